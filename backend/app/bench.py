@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+
+def _timed(fn, runs: int) -> list[float]:
+    samples: list[float] = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(
+        f"{label:<28} n={len(samples):<4} "
+        f"mean={statistics.fmean(samples):8.2f} ms  "
+        f"median={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms"
+    )
+
+
+def _bench_ocr(args) -> None:
+    from .services.ocr import preprocess_for_ocr
+    from .services.ocr_engine import create_engine
+
+    processed = preprocess_for_ocr(args.image)
+
+    for kind in ("pytesseract", "tesserocr"):
+        try:
+            engine = create_engine(kind=kind)
+            # Warm-up call, so the persistent engine's one-time load isn't counted per call.
+            engine.recognize(processed)
+        except Exception as e:
+            print(f"{kind:<28} unavailable: {e}")
+            continue
+        _report(f"{kind} ({engine.lang})", _timed(lambda: engine.recognize(processed), args.runs))
+        engine.close()
+
+
+def _bench_preprocess(args) -> None:
+    from .services.preprocess import run_pipeline
+
+    pipelines = args.pipeline or [
+        "crop,normalize,bilateral,adaptive",
+        "crop,normalize,gaussian,adaptive",
+        "crop,normalize,median,otsu",
+        "crop,normalize,gaussian,adaptive_fast",
+        "bilateral,adaptive",
+    ]
+    for spec in pipelines:
+        totals: dict[str, list[float]] = {}
+        for _ in range(args.runs):
+            for name, ms in run_pipeline(args.image, spec).timings.items():
+                totals.setdefault(name, []).append(ms)
+        overall = [sum(x) for x in zip(*totals.values())]
+        print(f"\n[{spec}]")
+        for name, samples in totals.items():
+            _report(f"  {name}", samples)
+        _report("  total", overall)
+
+
+def _bench_extract(args) -> None:
+    from .services.extract import extract_fields, extract_line_items, parse_document
+
+    with open(args.text, encoding="utf-8") as fh:
+        text = fh.read()
+
+    doc = parse_document(text)
+    _report("parse_document", _timed(lambda: parse_document(text), args.runs))
+    _report("  fields (parsed doc)", _timed(lambda: extract_fields(doc), args.runs))
+    _report("  line items (parsed doc)", _timed(lambda: extract_line_items(doc), args.runs))
+
+    def single_pass():
+        d = parse_document(text)
+        extract_fields(d)
+        extract_line_items(d)
+
+    def per_extractor():
+        # Every extractor gets the raw string and re-cleans it (the old call pattern).
+        extract_fields(text)
+        extract_line_items(text)
+
+    _report("single pass", _timed(single_pass, args.runs))
+    _report("re-parse per extractor", _timed(per_extractor, args.runs))
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Micro-benchmarks: `python -m backend.app.bench <target>`."""
+
+    parser = argparse.ArgumentParser(prog="python -m backend.app.bench")
+    sub = parser.add_subparsers(dest="target", required=True)
+
+    p = sub.add_parser("ocr", help="Per-call latency of each OCR engine on one image")
+    p.add_argument("image")
+    p.add_argument("--runs", type=int, default=20)
+    p.set_defaults(func=_bench_ocr)
+
+    p = sub.add_parser("preprocess", help="Per-stage wall time of preprocessing pipelines on one image")
+    p.add_argument("image")
+    p.add_argument("--pipeline", action="append", help="Stage list to time (repeatable)")
+    p.add_argument("--runs", type=int, default=10)
+    p.set_defaults(func=_bench_preprocess)
+
+    p = sub.add_parser("extract", help="Field/line-item extraction time on OCR text from a file")
+    p.add_argument("text")
+    p.add_argument("--runs", type=int, default=1000)
+    p.set_defaults(func=_bench_extract)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,129 @@
 from __future__ import annotations
 
+import time
+from typing import AsyncIterator
+
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from .config import get_settings
+from .services.metrics import Counter, GaugeFunc, Histogram
 
 
 class Base(DeclarativeBase):
     pass
 
 
+_ASYNC_DRIVERS = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+POOL_WAIT = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a pooled connection (waiting for a free one or opening a new one)",
+    ("engine",),
+)
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that gave up after pool_timeout", ("engine",))
+
+
+class _MeteredPool:
+    label = ""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            POOL_TIMEOUTS.inc(self.label)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - t0, self.label)
+
+
+class _SyncPool(_MeteredPool, QueuePool):
+    label = "sync"
+
+
+class _AsyncPool(_MeteredPool, AsyncAdaptedQueuePool):
+    label = "async"
+
+
+def _pool_options(url: str, poolclass: type) -> dict:
+    settings = get_settings()
+    if make_url(url).database in (None, "", ":memory:"):
+        # In-memory SQLite uses a single-connection pool without sizing options.
+        return {}
+    return {
+        # Also makes aiosqlite pool file databases (it defaults to NullPool).
+        "poolclass": poolclass,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
+
 def _create_engine():
     settings = get_settings()
     return create_engine(
         settings.database_url,
         pool_pre_ping=True,
         pool_recycle=3600,
+        **_pool_options(settings.database_url, _SyncPool),
     )
 
 
+def async_database_url() -> str:
+    settings = get_settings()
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    driver = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver known for {url.drivername}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
 engine = _create_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Created on first use, so CLI tools and workers don't need the async drivers.
+_async_engine: AsyncEngine | None = None
+_AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        url = async_database_url()
+        _async_engine = create_async_engine(
+            url, pool_pre_ping=True, pool_recycle=3600, **_pool_options(url, _AsyncPool)
+        )
+        # Handlers keep using loaded objects after commit (async sessions cannot lazy-load).
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _AsyncSessionLocal = None
+
+
+def _pool_stats(stat: str) -> dict[tuple, float]:
+    pools = {"sync": engine.pool}
+    if _async_engine is not None:
+        pools["async"] = _async_engine.pool
+    return {(name,): getattr(pool, stat)() for name, pool in pools.items() if isinstance(pool, QueuePool)}
+
+
+GaugeFunc("db_pool_size", "Persistent connections per pool", lambda: _pool_stats("size"), ("engine",))
+GaugeFunc("db_pool_checked_out", "Connections in use", lambda: _pool_stats("checkedout"), ("engine",))
+# Negative while the pool has not opened all of its persistent connections yet
+GaugeFunc("db_pool_overflow", "Connections opened beyond pool_size", lambda: _pool_stats("overflow"), ("engine",))
+
 
 def get_db():
     db = SessionLocal()
@@ -29,3 +131,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    get_async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 import time
-from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from .config import get_settings
-from .db import Base, engine
+from .db import SessionLocal, dispose_async_engine, engine
+from .middleware import RequestMetricsMiddleware
+from .migrations import ensure_schema
+from .routers.categories import router as categories_router
+from .routers.images import router as images_router
+from .routers.jobs import router as jobs_router
+from .routers.ocr_cache import router as ocr_cache_router
 from .routers.receipts import router as receipts_router
 from .routers.stats import router as stats_router
+from .services.category import seed_rules
+from .services.excel import ExcelCompactor
+from .services.ingest import create_excel_compactor
+from .services import metrics
+from .services.jobs import JobWorker, create_worker
+from .services.ocr_pool import shutdown_ocr_pool
+from .services.storage import get_image_store
 
 
 def create_app() -> FastAPI:
@@ -24,7 +35,14 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Listing pagination cursor, readable by a frontend on another origin
+        expose_headers=["X-Next-Cursor"],
     )
+    # Outermost, so CORS preflights and errors are counted too
+    app.add_middleware(RequestMetricsMiddleware)
+
+    worker: JobWorker | None = None
+    compactor: ExcelCompactor | None = None
 
     @app.on_event("startup")
     def _startup_create_tables_with_retry():
@@ -33,24 +51,64 @@ def create_app() -> FastAPI:
             try:
                 with engine.connect() as conn:
                     conn.exec_driver_sql("SELECT 1")
-                Base.metadata.create_all(bind=engine)
+                ensure_schema(engine)
+                with SessionLocal() as db:
+                    seed_rules(db)
                 return
             except Exception as e:
                 last_error = e
                 time.sleep(2)
         raise RuntimeError(f"Database not ready after retries: {last_error}")
 
+    @app.on_event("startup")
+    def _startup_image_store():
+        # Fail at startup, not on the first upload, when the image store is misconfigured.
+        get_image_store()
+
+    @app.on_event("startup")
+    def _startup_job_worker():
+        nonlocal worker
+        if settings.job_worker_in_process:
+            worker = create_worker()
+            worker.start()
+
+    @app.on_event("startup")
+    def _startup_excel_compactor():
+        nonlocal compactor
+        compactor = create_excel_compactor()
+        if compactor is not None:
+            compactor.start()
+
+    @app.on_event("shutdown")
+    def _shutdown_workers():
+        # Drain in-flight ingestion jobs before tearing down the OCR pool.
+        if worker is not None:
+            worker.stop()
+        shutdown_ocr_pool()
+        if compactor is not None:
+            compactor.stop()
+
+    @app.on_event("shutdown")
+    async def _shutdown_async_engine():
+        await dispose_async_engine()
+
     app.include_router(receipts_router)
+    app.include_router(jobs_router)
+    app.include_router(ocr_cache_router)
     app.include_router(stats_router)
-
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory=str(upload_dir)), name="uploads")
+    app.include_router(categories_router)
+    # Originals and derivatives under /uploads, from the configured image store
+    app.include_router(images_router)
 
     @app.get("/health")
     def health():
         return {"status": "ok"}
 
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        # Per process: with several uvicorn workers each one reports its own values.
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
     return app
 
 
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import argparse
+
+from .db import engine
+from .migrations import ensure_schema
+
+
+def _ocr_cache_invalidate(args) -> None:
+    from .services import ocr_cache
+
+    removed = ocr_cache.invalidate(all_entries=args.all)
+    print(f"Removed {removed} cached OCR entries")
+
+
+def _excel_compact(args) -> None:
+    from .services.excel import compact_journal
+    from .services.ingest import EXCEL_EXPORT_PATH
+
+    added = compact_journal(EXCEL_EXPORT_PATH)
+    print(f"Added {added} journaled rows to {EXCEL_EXPORT_PATH}")
+
+
+def _recategorize(args) -> None:
+    from .db import SessionLocal
+    from .services.category import recategorize_all, seed_rules
+
+    with SessionLocal() as db:
+        seed_rules(db)
+        result = recategorize_all(db)
+    print(f"Recategorized {result['changed']} receipts ({result['store_names']} distinct store names)")
+
+
+def _rollups_rebuild(args) -> None:
+    from .db import SessionLocal
+    from .services.rollups import rebuild_category_totals, rebuild_item_spending
+
+    with SessionLocal() as db:
+        result = rebuild_category_totals(db)
+        print(f"Rebuilt category totals: {result['rows']} rows ({result['groups_fixed']} receipt groups fixed)")
+        result = rebuild_item_spending(db)
+        print(
+            f"Rebuilt item spending: {result['items']} items, {result['rows']} daily rows "
+            f"({result['keys_fixed']} item keys fixed)"
+        )
+
+
+def _rollups_check(args) -> None:
+    from .db import SessionLocal
+    from .services.rollups import check_category_totals, check_item_spending
+
+    with SessionLocal() as db:
+        category_mismatches = check_category_totals(db)
+        item_mismatches = check_item_spending(db)
+    for m in category_mismatches:
+        print(
+            f"{m['group']} {m['day']}: rollup {m['rollup_total']} ({m['rollup_count']} receipts), "
+            f"expected {m['expected_total']} ({m['expected_count']} receipts)"
+        )
+    for m in item_mismatches:
+        print(
+            f"item {m['item_key']!r} {m['day']}: rollup {m['rollup_total']} ({m['rollup_count']} lines), "
+            f"expected {m['expected_total']} ({m['expected_count']} lines)"
+        )
+    if category_mismatches or item_mismatches:
+        raise SystemExit(
+            f"{len(category_mismatches) + len(item_mismatches)} rollup rows differ; run `rollups-rebuild`"
+        )
+    print("Rollups match the receipts")
+
+
+def _purchase_dates(args) -> None:
+    from .db import SessionLocal
+    from .services.timeseries import backfill_purchased_at
+
+    with SessionLocal() as db:
+        changed = backfill_purchased_at(db, reparse=args.all)
+    print(f"Updated the purchase date of {changed} receipts")
+
+
+def _images_migrate(args) -> None:
+    from .db import SessionLocal
+    from .services.storage import migrate_legacy_images
+
+    with SessionLocal() as db:
+        moved = migrate_legacy_images(db)
+    print(f"Moved {moved} images into the content-addressed store")
+
+
+def _images_gc(args) -> None:
+    from datetime import timedelta
+
+    from .db import SessionLocal
+    from .services.storage import collect_garbage
+
+    with SessionLocal() as db:
+        removed = collect_garbage(db, grace=timedelta(hours=args.grace_hours))
+    print(f"Deleted {removed} unreferenced images")
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Maintenance commands: `python -m backend.app.manage <command>`."""
+
+    parser = argparse.ArgumentParser(prog="python -m backend.app.manage")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser(
+        "ocr-cache-invalidate",
+        help="Drop cached OCR text from older preprocessing versions",
+    )
+    p.add_argument("--all", action="store_true", help="Drop every cached entry")
+    p.set_defaults(func=_ocr_cache_invalidate)
+
+    p = sub.add_parser("recategorize", help="Re-apply the category rules to every receipt")
+    p.set_defaults(func=_recategorize)
+
+    p = sub.add_parser("rollups-rebuild", help="Recompute the category totals and item spending rollups")
+    p.set_defaults(func=_rollups_rebuild)
+
+    p = sub.add_parser("rollups-check", help="Compare the rollups with a full recompute")
+    p.set_defaults(func=_rollups_check)
+
+    p = sub.add_parser("purchase-dates", help="Parse receipts' date text into purchased_at")
+    p.add_argument("--all", action="store_true", help="Re-parse every receipt, not only empty ones")
+    p.set_defaults(func=_purchase_dates)
+
+    p = sub.add_parser(
+        "images-migrate",
+        help="Move images stored under flat UPLOAD_DIR names into the content-addressed store",
+    )
+    p.set_defaults(func=_images_migrate)
+
+    p = sub.add_parser("images-gc", help="Delete stored images no receipt or pending job references")
+    p.add_argument(
+        "--grace-hours", type=float, default=24.0, help="Keep images released less than this long ago"
+    )
+    p.set_defaults(func=_images_gc)
+
+    p = sub.add_parser("excel-compact", help="Fold the upload journal into exports/receipts.xlsx now")
+    p.set_defaults(func=_excel_compact)
+
+    args = parser.parse_args(argv)
+    ensure_schema(engine)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
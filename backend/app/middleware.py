@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import time
+
+from starlette.routing import Mount, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .services.metrics import HTTP_DURATION, HTTP_REQUESTS
+
+
+class RequestMetricsMiddleware:
+    """Count and time HTTP requests per route template (e.g. /api/receipts/{receipt_id}).
+
+    Plain ASGI instead of BaseHTTPMiddleware, so the cost is two clock reads
+    and two dict updates per request. Requests that match no route share the
+    `unmatched` label to keep the label set bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: dict | None = None
+
+    def _route(self, scope: Scope) -> str:
+        if self._routes is None:
+            # The router records the matched endpoint (or mounted app) in the scope.
+            routes = scope["app"].routes
+            self._routes = {r.endpoint: r.path for r in routes if isinstance(r, Route)}
+            self._routes.update({r.app: r.path for r in routes if isinstance(r, Mount)})
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self._route(scope)
+            HTTP_DURATION.observe(time.perf_counter() - t0, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, status)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from sqlalchemy import Engine, inspect
+from sqlalchemy.orm import Session
+
+from . import models  # noqa: F401  (registers the tables on Base.metadata)
+from .db import Base
+
+
+def _rebuild_category_totals(db: Session) -> None:
+    from .services.rollups import rebuild_category_totals
+
+    rebuild_category_totals(db)
+
+
+def _backfill_purchased_at(db: Session) -> None:
+    from .services.timeseries import backfill_purchased_at
+
+    backfill_purchased_at(db)
+
+
+def _rebuild_item_spending(db: Session) -> None:
+    from .services.rollups import rebuild_item_spending
+
+    rebuild_item_spending(db)
+
+
+# Data backfills for derived tables/columns, run once when one of the listed
+# tables ("name") or columns ("table.column") has just been added.
+_BACKFILLS: list[tuple[set[str], Callable[[Session], None]]] = [
+    ({"category_daily_totals", "receipts.category_group"}, _rebuild_category_totals),
+    ({"item_daily_spending", "item_spending", "receipt_items.item_key"}, _rebuild_item_spending),
+    ({"receipts.purchased_at"}, _backfill_purchased_at),
+]
+
+
+def ensure_schema(engine: Engine) -> dict[str, list[str]]:
+    """Bring an existing database up to the models (there is no migration tool).
+
+    `create_all` only creates missing tables, so this also adds columns and
+    indexes that were introduced after a table was first created, then fills
+    derived data for what was added. Columns added this way must be nullable or
+    carry a `server_default`. Returns what was added.
+    """
+
+    existing_tables = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+
+    added: dict[str, list[str]] = {
+        "tables": [t.name for t in Base.metadata.sorted_tables if t.name not in existing_tables],
+        "columns": [],
+        "indexes": [],
+    }
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.exec_driver_sql(ddl)
+                added["columns"].append(f"{table.name}.{column.name}")
+
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    added["indexes"].append(index.name)
+
+    changes = set(added["tables"]) | set(added["columns"])
+    for triggers, backfill in _BACKFILLS:
+        if triggers & changes:
+            with Session(engine) as db:
+                backfill(db)
+
+    return added
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -16,8 +16,12 @@ class Receipt(Base):
 
     store_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     date: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # `date` parsed (services.extract.parse_receipt_date); None when unreadable
+    purchased_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     total_amount: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     category: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    # Dashboard group of `category` ("Ăn uống" / "Mua sắm" / "Khác"), see services.rollups
+    category_group: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
 
     image_path: Mapped[str] = mapped_column(String(512), nullable=False)
     raw_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -30,6 +34,16 @@ class Receipt(Base):
         passive_deletes=True,
     )
 
+    __table_args__ = (
+        # Listing order / keyset cursor, and its category-filtered variant
+        Index("ix_receipts_created_at_id", "created_at", "id"),
+        Index("ix_receipts_category_created_at", "category", "created_at"),
+        Index("ix_receipts_store_name", "store_name"),
+        # Spending time series: range scans that also cover the summed amount
+        Index("ix_receipts_purchased_at", "purchased_at", "total_amount"),
+        Index("ix_receipts_category_purchased_at", "category", "purchased_at", "total_amount"),
+    )
+
 
 class ReceiptItem(Base):
     __tablename__ = "receipt_items"
@@ -44,8 +58,139 @@ class ReceiptItem(Base):
     )
 
     item_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Normalized item_name (services.text.item_key), groups OCR variants of one product
+    item_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, index=True)
     quantity: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     unit_price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     total_price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
     receipt: Mapped[Receipt] = relationship(back_populates="items")
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+    # queued -> running -> done | failed (running jobs with an expired lease are re-queued)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued", index=True)
+
+    image_path: Mapped[str] = mapped_column(String(512), nullable=False)
+    image_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
+    # Preprocessing stages requested for this upload (None = OCR_PIPELINE setting)
+    pipeline: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    receipt_id: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        ForeignKey("receipts.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    worker_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+
+class OcrCacheEntry(Base):
+    __tablename__ = "ocr_cache"
+
+    # sha256 of (image bytes hash, OCR lang, engine, tesseract config, preprocess signature)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+    image_sha256: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    preprocess_version: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    raw_text: Mapped[str] = mapped_column(Text, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CategoryRule(Base):
+    __tablename__ = "category_rules"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+    # Merchant needle, lowercase without diacritics (store names are folded the same way)
+    pattern: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    category: Mapped[str] = mapped_column(String(128), nullable=False)
+
+    # When several rules match, the lowest priority (then lowest id) wins
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=100)
+
+    # Only match the pattern as a whole word ("be" must not match "beauty")
+    whole_word: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    # Monotonic change counter per data set (e.g. "category_rules"), so caches in
+    # other processes can tell when to rebuild.
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+
+class CategoryDailyTotal(Base):
+    __tablename__ = "category_daily_totals"
+
+    # Receipt totals per category group and created_at day, kept in step with
+    # `receipts` by the write paths (rebuild: `manage rollups-rebuild`).
+    group_name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    total: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    receipt_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ItemDailySpending(Base):
+    __tablename__ = "item_daily_spending"
+
+    # Line item spending per item key and receipt created_at day (date windows)
+    item_key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    total_spent: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    line_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ItemSpending(Base):
+    __tablename__ = "item_spending"
+
+    # All-time line item spending per item key (top-N without a date window)
+    item_key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Display name: the first spelling seen for this key
+    item_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    total_spent: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, index=True)
+    line_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    # Storage key of a content-addressed image (services.storage.content_key)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+
+    # Receipts and unfinished ingest jobs referencing the image (a job's reference
+    # passes to the receipt it creates). At 0 the blob is left for `manage images-gc`.
+    refcount: Mapped[int] = mapped_column(Integer, nullable=False, default=0, index=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    # Last store, reference or release; images-gc only deletes blobs unused for a grace period
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import delete, insert, select, update
+
+from .db import SessionLocal, engine
+from .migrations import ensure_schema
+from .models import Receipt, ReceiptItem
+from .services.category import get_matcher, pin_matcher
+from .services.extract import extract_fields, extract_line_items, parse_document, parse_receipt_date
+from .services.rollups import (
+    CategoryDeltas,
+    ItemDeltas,
+    add_item_delta,
+    add_receipt_delta,
+    apply_category_deltas,
+    apply_item_deltas,
+    category_group,
+)
+from .services.text import item_key
+from .services.versions import receipts_changed
+
+
+DEFAULT_CHECKPOINT = "exports/reextract.checkpoint.json"
+
+_FIELDS = ("store_name", "date", "purchased_at", "total_amount", "category", "category_group")
+
+ItemRow = tuple[str | None, float | None, float | None, float | None]
+
+
+def reextract_text(receipt_id: int, raw_text: str | None) -> tuple[int, dict, list[ItemRow]]:
+    """Re-run extraction + categorization on stored OCR text. Runs in a pool worker."""
+
+    doc = parse_document(raw_text or "")
+    fields = extract_fields(doc)
+    try:
+        items = extract_line_items(doc)
+    except Exception:
+        items = []
+
+    category = get_matcher().categorize(fields.store_name)
+    values = {
+        "store_name": fields.store_name,
+        "date": fields.date,
+        "purchased_at": parse_receipt_date(fields.date),
+        "total_amount": fields.total_amount,
+        "category": category,
+        "category_group": category_group(category),
+    }
+    rows = [(it.item_name, it.quantity, it.unit_price, it.total_price) for it in items]
+    return receipt_id, values, rows
+
+
+def _reextract_one(row: tuple[int, str | None]) -> tuple[int, dict, list[ItemRow]]:
+    return reextract_text(*row)
+
+
+def _load_checkpoint(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_checkpoint(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _existing_items(db, ids: list[int]) -> dict[int, list[ItemRow]]:
+    out: dict[int, list[ItemRow]] = {i: [] for i in ids}
+    rows = db.execute(
+        select(
+            ReceiptItem.receipt_id,
+            ReceiptItem.item_name,
+            ReceiptItem.quantity,
+            ReceiptItem.unit_price,
+            ReceiptItem.total_price,
+        )
+        .where(ReceiptItem.receipt_id.in_(ids))
+        .order_by(ReceiptItem.receipt_id, ReceiptItem.id)
+    )
+    for receipt_id, *item in rows:
+        out[receipt_id].append(tuple(item))
+    return out
+
+
+def _print_diff(
+    receipt_id: int,
+    old: dict,
+    new: dict,
+    old_items: list[ItemRow] | None,
+    new_items: list[ItemRow],
+) -> None:
+    print(f"receipt #{receipt_id}")
+    for name in _FIELDS:
+        if old[name] != new[name]:
+            print(f"  {name}: {old[name]!r} -> {new[name]!r}")
+    if old_items is not None and old_items != new_items:
+        print(f"  items: {len(old_items)} -> {len(new_items)}")
+        for row in old_items:
+            if row not in new_items:
+                print(f"    - {row}")
+        for row in new_items:
+            if row not in old_items:
+                print(f"    + {row}")
+
+
+def run(
+    batch_size: int = 500,
+    workers: int | None = None,
+    dry_run: bool = False,
+    with_items: bool = True,
+    checkpoint: str | None = DEFAULT_CHECKPOINT,
+    restart: bool = False,
+) -> dict:
+    """Re-extract every receipt from its raw_text, in id order and bounded batches.
+
+    Each batch is one transaction (bulk UPDATE of changed receipts, items
+    replaced for receipts whose items changed); the last committed id is saved
+    to `checkpoint` so an interrupted run resumes where it stopped. The file is
+    removed once the run completes.
+    """
+
+    ckpt_path = Path(checkpoint) if checkpoint and not dry_run else None
+    state = {"last_id": 0, "scanned": 0, "changed": 0, "items_replaced": 0}
+    if ckpt_path is not None and not restart:
+        state.update(_load_checkpoint(ckpt_path))
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    scanned_before = state["scanned"]
+
+    with SessionLocal() as db:
+        # Workers categorize with the parent's rule set instead of each querying the DB.
+        rules = get_matcher(db, refresh=True).rules
+
+    with (
+        ProcessPoolExecutor(max_workers=workers, initializer=pin_matcher, initargs=(rules,)) as pool,
+        SessionLocal() as db,
+    ):
+        while True:
+            rows = db.execute(
+                select(
+                    Receipt.id,
+                    Receipt.raw_text,
+                    Receipt.store_name,
+                    Receipt.date,
+                    Receipt.purchased_at,
+                    Receipt.total_amount,
+                    Receipt.category,
+                    Receipt.category_group,
+                    Receipt.created_at,
+                )
+                .where(Receipt.id > state["last_id"])
+                .order_by(Receipt.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            current = {r.id: {name: getattr(r, name) for name in _FIELDS} for r in rows}
+            created = {r.id: r.created_at for r in rows}
+            chunksize = max(1, len(rows) // (workers * 4))
+            results = list(pool.map(_reextract_one, [(r.id, r.raw_text) for r in rows], chunksize=chunksize))
+            old_items = _existing_items(db, list(current)) if with_items else {}
+
+            updates: list[dict] = []
+            item_changes: dict[int, list[ItemRow]] = {}
+            deltas: CategoryDeltas = {}
+            for receipt_id, values, new_items in results:
+                old = current[receipt_id]
+                fields_changed = values != old
+                items_changed = with_items and new_items != old_items[receipt_id]
+                if fields_changed:
+                    updates.append({"id": receipt_id, **values})
+                    # Move the receipt's amount between rollup groups/values.
+                    day = created[receipt_id]
+                    add_receipt_delta(deltas, old["category_group"], day, -(old["total_amount"] or 0.0), count=-1)
+                    add_receipt_delta(deltas, values["category_group"], day, values["total_amount"])
+                if items_changed:
+                    item_changes[receipt_id] = new_items
+                if dry_run and (fields_changed or items_changed):
+                    _print_diff(
+                        receipt_id,
+                        old,
+                        values,
+                        old_items.get(receipt_id) if items_changed else None,
+                        new_items,
+                    )
+
+            if not dry_run:
+                if updates:
+                    db.execute(update(Receipt), updates)
+                    apply_category_deltas(db, deltas)
+                if item_changes:
+                    ids = list(item_changes)
+                    db.execute(delete(ReceiptItem).where(ReceiptItem.receipt_id.in_(ids)))
+                    new_rows = [
+                        {
+                            "receipt_id": receipt_id,
+                            "item_name": name,
+                            "item_key": item_key(name),
+                            "quantity": qty,
+                            "unit_price": unit,
+                            "total_price": total,
+                        }
+                        for receipt_id, items in item_changes.items()
+                        for name, qty, unit, total in items
+                    ]
+                    if new_rows:
+                        db.execute(insert(ReceiptItem), new_rows)
+                    item_deltas: ItemDeltas = {}
+                    for receipt_id, items in item_changes.items():
+                        day = created[receipt_id]
+                        for name, _, _, total in old_items[receipt_id]:
+                            add_item_delta(item_deltas, name, day, -(total or 0.0), count=-1)
+                        for name, _, _, total in items:
+                            add_item_delta(item_deltas, name, day, total)
+                    apply_item_deltas(db, item_deltas)
+                if updates or item_changes:
+                    receipts_changed(db)
+                db.commit()
+
+            state["last_id"] = rows[-1].id
+            state["scanned"] += len(rows)
+            state["changed"] += len({u["id"] for u in updates} | set(item_changes))
+            state["items_replaced"] += len(item_changes)
+            if ckpt_path is not None:
+                _save_checkpoint(ckpt_path, state)
+
+            elapsed = time.perf_counter() - started
+            rate = (state["scanned"] - scanned_before) / elapsed if elapsed else 0.0
+            print(
+                f"up to id {state['last_id']}: scanned {state['scanned']}, "
+                f"changed {state['changed']} ({rate:.0f} receipts/s)"
+            )
+
+    # Finished: the next run starts from the beginning again.
+    if ckpt_path is not None:
+        ckpt_path.unlink(missing_ok=True)
+    return state
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Re-run field/item extraction and categorization on stored OCR text:
+    `python -m backend.app.reextract [--dry-run]`.
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m backend.app.reextract")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would change; write nothing")
+    parser.add_argument("--skip-items", action="store_true", help="Only update receipt fields, keep line items")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Resume file (last committed receipt id)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    ensure_schema(engine)
+    state = run(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        dry_run=args.dry_run,
+        with_items=not args.skip_items,
+        checkpoint=args.checkpoint,
+        restart=args.restart,
+    )
+    verb = "Would change" if args.dry_run else "Changed"
+    print(f"{verb} {state['changed']} of {state['scanned']} receipts ({state['items_replaced']} with new line items)")
+
+
+if __name__ == "__main__":
+    main()
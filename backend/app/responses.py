@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class _EncodedJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return super().render(jsonable_encoder(content))
+
+
+# For endpoints that return plain rows/dicts (datetimes included) and skip
+# response-model validation: orjson when installed, the stdlib encoder otherwise.
+FastJSONResponse: type[JSONResponse] = ORJSONResponse if orjson is not None else _EncodedJSONResponse
+
+
+def make_etag(version: int, *parts: Any) -> str:
+    """Strong ETag for a response derived from receipts data at `version`.
+
+    `parts` are whatever else shapes the body besides the URL's data version
+    (e.g. a resolved default date window).
+    """
+
+    tag = str(version)
+    if parts:
+        tag += "-" + hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f'"{tag}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison (a W/ prefix is ignored).
+    return any(t.strip().removeprefix("W/") == etag for t in header.split(","))
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    # Clients may keep the body but must revalidate it on every use.
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..db import get_db
+from ..models import CategoryRule
+from ..schemas import CategoryRuleIn, CategoryRuleOut, RecategorizeOut
+from ..services.category import DEFAULT_CATEGORY, fold, get_matcher, recategorize_all, rules_changed
+
+router = APIRouter(prefix="/api/categories", tags=["categories"])
+
+
+def _apply(rule: CategoryRule, payload: CategoryRuleIn) -> None:
+    # Stored folded (the form the matcher uses), so the unique index catches
+    # case/accent variants of an existing pattern.
+    pattern = fold(payload.pattern)
+    category = payload.category.strip()
+    if not pattern or not category:
+        raise HTTPException(status_code=400, detail="pattern and category must not be empty")
+    rule.pattern = pattern
+    rule.category = category
+    rule.priority = payload.priority
+    rule.whole_word = payload.whole_word
+
+
+def _commit_rule(db: Session, rule: CategoryRule) -> CategoryRule:
+    rules_changed(db)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="A rule with this pattern already exists")
+    db.refresh(rule)
+    return rule
+
+
+@router.get("/rules", response_model=list[CategoryRuleOut])
+def list_rules(db: Session = Depends(get_db)):
+    return db.execute(select(CategoryRule).order_by(CategoryRule.priority, CategoryRule.id)).scalars().all()
+
+
+@router.post("/rules", response_model=CategoryRuleOut)
+def create_rule(payload: CategoryRuleIn, db: Session = Depends(get_db)):
+    rule = CategoryRule()
+    _apply(rule, payload)
+    db.add(rule)
+    return _commit_rule(db, rule)
+
+
+@router.put("/rules/{rule_id}", response_model=CategoryRuleOut)
+def update_rule(rule_id: int, payload: CategoryRuleIn, db: Session = Depends(get_db)):
+    rule = db.get(CategoryRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    _apply(rule, payload)
+    return _commit_rule(db, rule)
+
+
+@router.delete("/rules/{rule_id}")
+def delete_rule(rule_id: int, db: Session = Depends(get_db)):
+    rule = db.get(CategoryRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    db.delete(rule)
+    rules_changed(db)
+    db.commit()
+    return {"deleted": rule_id}
+
+
+@router.get("/match")
+def match_store(store_name: str, db: Session = Depends(get_db)):
+    """Which rule (if any) the current rule set applies to a store name."""
+
+    rule = get_matcher(db).match(store_name)
+    if rule is None:
+        return {"category": DEFAULT_CATEGORY, "rule_id": None, "pattern": None}
+    return {"category": rule.category, "rule_id": rule.rule_id, "pattern": rule.pattern}
+
+
+@router.post("/recategorize", response_model=RecategorizeOut)
+def recategorize(db: Session = Depends(get_db)):
+    """Re-apply the current rules to every stored receipt."""
+
+    return recategorize_all(db)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import re
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+
+from ..responses import etag_matches
+from ..services.storage import ImageStore, RangeNotSatisfiable, get_image_store, media_type
+from ..services.thumbnails import SIZES, ensure_derivative
+
+router = APIRouter(prefix="/uploads", tags=["images"])
+
+# Stored names never get other bytes, so everything under /uploads can be cached for good.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_STEM = re.compile(r"[0-9A-Za-z_-]+")
+# Content-addressed "ab/cd/<sha256>.<ext>", or a flat name from before it
+_ORIGINAL = re.compile(r"(?:[0-9a-f]{2}/[0-9a-f]{2}/)?[0-9A-Za-z_-]+\.[A-Za-z0-9]+")
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Image not found")
+
+
+async def _serve(request: Request, store: ImageStore, key: str) -> Response:
+    """One stored image with ETag/If-None-Match, Range and immutable caching."""
+
+    if store.local:
+        path = store.local_path(key)
+        try:
+            stat_result = await run_in_threadpool(os.stat, path)
+        except FileNotFoundError:
+            raise _not_found()
+        response = FileResponse(
+            path, stat_result=stat_result, media_type=media_type(key), headers={"Cache-Control": IMMUTABLE}
+        )
+        etag = response.headers["etag"]
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE})
+        return response
+
+    try:
+        obj = await run_in_threadpool(store.open, key, request.headers.get("range"))
+    except RangeNotSatisfiable as e:
+        headers = {"Accept-Ranges": "bytes"}
+        if e.size is not None:
+            headers["Content-Range"] = f"bytes */{e.size}"
+        return Response(status_code=416, headers=headers)
+    if obj is None:
+        raise _not_found()
+    headers = {"ETag": obj.etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+    if etag_matches(request, obj.etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(obj.length)
+    if obj.content_range:
+        headers["Content-Range"] = obj.content_range
+    return StreamingResponse(
+        obj.body,
+        status_code=206 if obj.content_range else 200,
+        media_type=media_type(key),
+        headers=headers,
+    )
+
+
+@router.api_route("/{size}/{name}", methods=["GET", "HEAD"])
+async def get_derivative(size: str, name: str, request: Request):
+    """WebP `thumb` or `view` of an upload: `/uploads/thumb/<stored name without ext>.webp`.
+
+    Generated at ingest; older uploads get theirs on the first request.
+    """
+
+    stem, ext = os.path.splitext(name)
+    if size not in SIZES or ext != ".webp" or not _STEM.fullmatch(stem):
+        raise _not_found()
+
+    store = get_image_store()
+    try:
+        key = await run_in_threadpool(ensure_derivative, store, size, stem)
+    except ValueError:
+        # The original exists but can't be decoded.
+        key = None
+    if key is None:
+        raise _not_found()
+    return await _serve(request, store, key)
+
+
+@router.api_route("/{key:path}", methods=["GET", "HEAD"])
+async def get_original(key: str, request: Request):
+    if not _ORIGINAL.fullmatch(key):
+        raise _not_found()
+    return await _serve(request, get_image_store(), key)
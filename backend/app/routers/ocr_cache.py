@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+
+from ..services import ocr_cache
+
+router = APIRouter(prefix="/api/ocr-cache", tags=["ocr-cache"])
+
+
+@router.get("/stats")
+def cache_stats():
+    stats = ocr_cache.get_ocr_cache().stats()
+    stats["persisted_entries"] = ocr_cache.persisted_count()
+    return stats
+
+
+@router.delete("")
+async def invalidate_cache(all: bool = False):
+    # Default: drop entries from older preprocessing versions only.
+    removed = await run_in_threadpool(ocr_cache.invalidate, all)
+    return {"removed": removed}
@@ -1,178 +1,262 @@
 from __future__ import annotations
 
-import os
-import uuid
-from pathlib import Path
-
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
-from sqlalchemy import delete, desc, select
+import asyncio
+import zipfile
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, selectinload
+from starlette.background import BackgroundTask
 
 from ..config import get_settings
-from ..db import get_db
-from ..models import Receipt, ReceiptItem
+from ..db import SessionLocal, get_async_db, get_db
+from ..models import IngestJob, Receipt, ReceiptItem
+from ..responses import FastJSONResponse, cache_headers, etag_matches, make_etag, not_modified
 from ..schemas import (
+    BatchFileResult,
+    BatchUploadOut,
+    JobOut,
     ReceiptDetailOut,
     ReceiptItemCreate,
     ReceiptItemOut,
     ReceiptItemsReplaceIn,
     ReceiptOut,
 )
-from ..services.category import categorize
-from ..services.extract import clean_ocr_text, extract_fields, extract_line_items
-from ..services.excel import append_receipt_to_excel
-from ..services.ocr import ensure_upload_dir, run_tesseract
+from ..services import ocr_cache
+from ..services.export import (
+    ExportFilter,
+    ExportUnavailable,
+    build_export_file,
+    cached_export,
+    check_format,
+    stream_export,
+)
+from ..services.image_probe import PROBE_BYTES, ImageTooLarge, UnsupportedImage, inspect_image
+from ..services.ingest import (
+    UploadTooLarge,
+    append_to_excel,
+    content_sha256,
+    count_batch_entries,
+    iter_batch_entries,
+    save_receipts,
+    save_upload,
+    store_image,
+)
+from ..services.jobs import count_queued_jobs, enqueue_job
+from ..services.listing import InvalidCursor, list_receipts_page
+from ..services.metrics import observe_ocr_timings
+from ..services.ocr_pool import OcrResult, get_ocr_pool, process_image
+from ..services.preprocess import parse_pipeline
+from ..services.rollups import ItemValues, items_replaced, receipts_removed
+from ..services.storage import release_image
+from ..services.thumbnails import create_derivatives
+from ..services.text import item_key
+from ..services.versions import receipts_changed, receipts_version
 
 router = APIRouter(prefix="/api/receipts", tags=["receipts"])
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
-@router.get("/export")
-def export_excel(db: Session = Depends(get_db)):
-    export_path = Path("exports/receipts.xlsx")
-
-    # Create/overwrite export file
-    from openpyxl import Workbook
-
-    wb = Workbook()
-
-    ws_receipts = wb.active
-    ws_receipts.title = "receipts"
-    ws_receipts.append(
-        [
-            "id",
-            "store_name",
-            "date",
-            "total_amount",
-            "category",
-            "image_path",
-            "created_at",
-        ]
-    )
 
-    ws_items = wb.create_sheet(title="items")
-    ws_items.append(
-        [
-            "receipt_id",
-            "item_name",
-            "quantity",
-            "unit_price",
-            "total_price",
-            "item_id",
-        ]
-    )
+_EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
 
-    receipts = (
-        db.execute(
-            select(Receipt)
-            .options(selectinload(Receipt.items))
-            .order_by(desc(Receipt.created_at))
-        )
-        .scalars()
-        .all()
-    )
 
-    for r in receipts:
-        ws_receipts.append(
-            [
-                r.id,
-                r.store_name,
-                r.date,
-                r.total_amount,
-                r.category,
-                r.image_path,
-                r.created_at.isoformat() if r.created_at else None,
-            ]
-        )
-        for it in (r.items or []):
-            ws_items.append(
-                [
-                    r.id,
-                    it.item_name,
-                    it.quantity,
-                    it.unit_price,
-                    it.total_price,
-                    it.id,
-                ]
-            )
+@router.get("/export")
+def export_receipts(
+    fmt: str = Query("xlsx", alias="format"),
+    layout: str = "joined",
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    category: str | None = None,
+    store: str | None = None,
+    since_id: int | None = None,
+    min_total: float | None = None,
+    max_total: float | None = None,
+    db: Session = Depends(get_db),
+):
+    """Export receipts and items as xlsx, csv, ndjson or parquet.
+
+    Filters narrow the receipts (created_at range, category, store name
+    substring, id > since_id for incremental pulls, total_amount range). csv/ndjson/parquet are
+    streamed from the DB; `layout=files` returns a zip with receipts and items
+    as separate files instead of one joined file.
+    """
 
-    export_path.parent.mkdir(parents=True, exist_ok=True)
-    wb.save(export_path)
+    settings = get_settings()
+    fmt = fmt.lower()
+    filters = ExportFilter(created_from, created_to, category, store, since_id, min_total, max_total)
+    try:
+        check_format(fmt, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    if fmt == "xlsx":
+        if filters.empty:
+            path = cached_export(db)
+            background = None
+        else:
+            path = build_export_file(db, filters)
+            background = BackgroundTask(path.unlink, missing_ok=True)
+        return FileResponse(
+            path=str(path),
+            media_type=_EXPORT_MEDIA_TYPES["xlsx"],
+            filename="receipts.xlsx",
+            background=background,
+        )
 
-    return FileResponse(
-        path=str(export_path),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        filename="receipts.xlsx",
+    filename = f"receipts.{fmt}" if layout == "joined" else f"receipts-{fmt}.zip"
+    return StreamingResponse(
+        stream_export(fmt, layout, filters, SessionLocal, settings.export_chunk_size),
+        media_type=_EXPORT_MEDIA_TYPES[fmt] if layout == "joined" else "application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
 @router.get("", response_model=list[ReceiptOut])
-def list_receipts(db: Session = Depends(get_db)):
-    receipts = db.execute(select(Receipt).order_by(desc(Receipt.created_at))).scalars().all()
-    return receipts
+async def list_receipts(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    category: str | None = None,
+    store: str | None = None,
+    min_total: float | None = None,
+    max_total: float | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Receipts newest first, `limit` per page.
+
+    The next page's cursor is returned in the X-Next-Cursor header (absent on
+    the last page); pass it back as `cursor` with the same filters.
+    """
+
+    etag = make_etag(await db.run_sync(receipts_version))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    filters = ExportFilter(
+        created_from, created_to, category, store, min_total=min_total, max_total=max_total
+    )
+    try:
+        rows, next_cursor = await db.run_sync(list_receipts_page, filters, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = cache_headers(etag)
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return FastJSONResponse([row._asdict() for row in rows], headers=headers)
 
 
 @router.get("/{receipt_id}", response_model=ReceiptDetailOut)
-def get_receipt(receipt_id: int, db: Session = Depends(get_db)):
+async def get_receipt(
+    receipt_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    etag = make_etag(await db.run_sync(receipts_version))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     receipt = (
-        db.execute(
-            select(Receipt)
-            .options(selectinload(Receipt.items))
-            .where(Receipt.id == receipt_id)
+        (
+            await db.execute(
+                select(Receipt)
+                .options(selectinload(Receipt.items))
+                .where(Receipt.id == receipt_id)
+            )
         )
         .scalars()
         .first()
     )
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
+    response.headers.update(cache_headers(etag))
     return receipt
 
 
 @router.get("/{receipt_id}/items", response_model=list[ReceiptItemOut])
-def list_receipt_items(receipt_id: int, db: Session = Depends(get_db)):
-    receipt = db.get(Receipt, receipt_id)
+async def list_receipt_items(
+    receipt_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    etag = make_etag(await db.run_sync(receipts_version))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    receipt = await db.get(Receipt, receipt_id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
-    items = (
-        db.execute(
-            select(ReceiptItem)
-            .where(ReceiptItem.receipt_id == receipt_id)
-            .order_by(ReceiptItem.id.asc())
-        )
-        .scalars()
-        .all()
-    )
+    items = await _receipt_items(db, receipt_id)
+    response.headers.update(cache_headers(etag))
     return items
 
 
+async def _receipt_items(db: AsyncSession, receipt_id: int) -> list[ReceiptItem]:
+    result = await db.execute(
+        select(ReceiptItem)
+        .where(ReceiptItem.receipt_id == receipt_id)
+        .order_by(ReceiptItem.id.asc())
+    )
+    return list(result.scalars().all())
+
+
+def _items_changed(db: Session, day: datetime, old: Iterable[ItemValues] = (), new: Iterable[ItemValues] = ()) -> None:
+    # Rollup and data-version bookkeeping of an item edit (sync helpers, run via run_sync).
+    items_replaced(db, day, old=old, new=new)
+    receipts_changed(db)
+
+
 @router.post("/{receipt_id}/items", response_model=ReceiptItemOut)
-def add_receipt_item(receipt_id: int, payload: ReceiptItemCreate, db: Session = Depends(get_db)):
-    receipt = db.get(Receipt, receipt_id)
+async def add_receipt_item(
+    receipt_id: int, payload: ReceiptItemCreate, db: AsyncSession = Depends(get_async_db)
+):
+    receipt = await db.get(Receipt, receipt_id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
     item = ReceiptItem(
         receipt_id=receipt_id,
         item_name=payload.item_name,
+        item_key=item_key(payload.item_name),
         quantity=payload.quantity,
         unit_price=payload.unit_price,
         total_price=payload.total_price,
     )
     db.add(item)
-    db.commit()
-    db.refresh(item)
+    await db.flush()
+    await db.run_sync(_items_changed, receipt.created_at, new=[(item.item_name, item.total_price)])
+    await db.commit()
+    await db.refresh(item)
     return item
 
 
 @router.put("/{receipt_id}/items", response_model=list[ReceiptItemOut])
-def replace_receipt_items(receipt_id: int, payload: ReceiptItemsReplaceIn, db: Session = Depends(get_db)):
-    receipt = db.get(Receipt, receipt_id)
+async def replace_receipt_items(
+    receipt_id: int, payload: ReceiptItemsReplaceIn, db: AsyncSession = Depends(get_async_db)
+):
+    receipt = await db.get(Receipt, receipt_id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
     # Replace existing items atomically.
-    db.execute(delete(ReceiptItem).where(ReceiptItem.receipt_id == receipt_id))
+    old = (
+        await db.execute(
+            select(ReceiptItem.item_name, ReceiptItem.total_price).where(ReceiptItem.receipt_id == receipt_id)
+        )
+    ).all()
+    await db.execute(delete(ReceiptItem).where(ReceiptItem.receipt_id == receipt_id))
 
     created: list[ReceiptItem] = []
     for it in payload.items:
@@ -180,6 +264,7 @@ def replace_receipt_items(receipt_id: int, payload: ReceiptItemsReplaceIn, db: S
             ReceiptItem(
                 receipt_id=receipt_id,
                 item_name=it.item_name,
+                item_key=item_key(it.item_name),
                 quantity=it.quantity,
                 unit_price=it.unit_price,
                 total_price=it.total_price,
@@ -189,104 +274,228 @@ def replace_receipt_items(receipt_id: int, payload: ReceiptItemsReplaceIn, db: S
     if created:
         db.add_all(created)
 
-    db.commit()
-
-    items = (
-        db.execute(
-            select(ReceiptItem)
-            .where(ReceiptItem.receipt_id == receipt_id)
-            .order_by(ReceiptItem.id.asc())
-        )
-        .scalars()
-        .all()
+    await db.run_sync(
+        _items_changed,
+        receipt.created_at,
+        old=[tuple(row) for row in old],
+        new=[(it.item_name, it.total_price) for it in created],
     )
-    return items
+    await db.commit()
 
+    return await _receipt_items(db, receipt_id)
 
-@router.post("/upload", response_model=ReceiptDetailOut)
-async def upload_receipt(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    settings = get_settings()
-    upload_dir = ensure_upload_dir(settings.upload_dir)
-
-    ext = Path(file.filename or "").suffix.lower()
-    if ext not in {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}:
-        raise HTTPException(status_code=400, detail="Unsupported file type")
 
-    filename = f"{uuid.uuid4().hex}{ext}"
-    dest_path = upload_dir / filename
+def _remove_receipt(db: Session, receipt: Receipt) -> None:
+    # Rollups, the image reference and the job link go in the same transaction as the receipt.
+    receipts_removed(db, [receipt])
+    release_image(db, receipt.image_path)
+    db.execute(update(IngestJob).where(IngestJob.receipt_id == receipt.id).values(receipt_id=None))
+    db.delete(receipt)
+    receipts_changed(db)
 
-    content = await file.read()
-    dest_path.write_bytes(content)
 
-    try:
-        raw_text = run_tesseract(str(dest_path))
-    except Exception as e:
-        raise HTTPException(
-            status_code=422,
-            detail=(
-                "OCR failed. Make sure Tesseract is installed and Vietnamese language pack is available. "
-                f"Details: {e}"
-            ),
+@router.delete("/{receipt_id}", status_code=204)
+async def delete_receipt(receipt_id: int, db: AsyncSession = Depends(get_async_db)):
+    receipt = (
+        (
+            await db.execute(
+                select(Receipt)
+                .options(selectinload(Receipt.items))
+                .where(Receipt.id == receipt_id)
+            )
         )
+        .scalars()
+        .first()
+    )
+    if not receipt:
+        raise HTTPException(status_code=404, detail="Receipt not found")
 
-    raw_text = clean_ocr_text(raw_text)
-
-    fields = extract_fields(raw_text)
-    category = categorize(fields.store_name)
+    await db.run_sync(_remove_receipt, receipt)
+    await db.commit()
+    return Response(status_code=204)
 
-    image_path = str(dest_path.as_posix())
-    if os.name == "nt":
-        image_path = image_path.replace("\\", "/")
 
-    receipt = Receipt(
-        store_name=fields.store_name,
-        date=fields.date,
-        total_amount=fields.total_amount,
-        category=category,
-        image_path=image_path,
-        raw_text=raw_text,
-    )
+def _check_pipeline(pipeline: str | None) -> str | None:
+    if pipeline is None or not pipeline.strip():
+        return None
+    try:
+        return ",".join(parse_pipeline(pipeline))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
 
-    # Extract and persist line items (best-effort).
-    try:
-        extracted_items = extract_line_items(raw_text)
-        if extracted_items:
-            db.add_all(
-                [
-                    ReceiptItem(
-                        receipt_id=receipt.id,
-                        item_name=it.item_name,
-                        quantity=it.quantity,
-                        unit_price=it.unit_price,
-                        total_price=it.total_price,
-                    )
-                    for it in extracted_items
-                ]
+@router.post("/upload", response_model=JobOut, status_code=202)
+async def upload_receipt(
+    file: UploadFile = File(...),
+    pipeline: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    settings = get_settings()
+    pipeline = _check_pipeline(pipeline)
+
+    if file.size is not None and file.size > settings.max_upload_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (max {settings.max_upload_bytes} bytes)")
+
+    if settings.job_queue_limit > 0:
+        queued = await db.run_sync(count_queued_jobs)
+        if queued >= settings.job_queue_limit:
+            raise HTTPException(
+                status_code=503,
+                detail="OCR queue is full, please retry later",
+                headers={"Retry-After": str(settings.ocr_retry_after)},
             )
-            db.commit()
-    except Exception:
-        # Don't fail upload if item extraction is imperfect.
-        pass
 
-    # Return with items preloaded for the detail page.
-    receipt = (
-        db.execute(
-            select(Receipt)
-            .options(selectinload(Receipt.items))
-            .where(Receipt.id == receipt.id)
+    try:
+        stored = await run_in_threadpool(
+            save_upload,
+            file.file,
+            settings.max_upload_bytes,
+            settings.max_image_pixels,
         )
-        .scalars()
-        .first()
-    )
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (UploadTooLarge, ImageTooLarge) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    # OCR/extraction happen in the ingestion workers; poll /api/jobs/{id} for the result.
+    return await db.run_sync(enqueue_job, stored.image_path, stored.sha256, pipeline)
+
+
+def _count_batch(files: list[UploadFile]) -> int:
+    return sum(count_batch_entries(f.file) for f in files)
+
+
+def _iter_batch(
+    files: list[UploadFile], max_bytes: int, max_pixels: int
+) -> Iterator[tuple[str, bytes | None, str | None, str | None]]:
+    # (name, content, ext sniffed from magic bytes, error)
+    for f in files:
+        filename = f.filename or "upload"
+        try:
+            for name, content, error in iter_batch_entries(filename, f.file, max_bytes):
+                if error is not None:
+                    yield name, None, None, error
+                    continue
+                try:
+                    info = inspect_image(content[:PROBE_BYTES], max_pixels)
+                except ValueError as e:
+                    yield name, None, None, str(e)
+                    continue
+                yield name, content, info.ext, None
+        except zipfile.BadZipFile:
+            yield filename, None, None, "Invalid ZIP archive"
+
+
+async def _save_batch(
+    db: AsyncSession, ok: list[tuple[int, str, OcrResult]], chunk_size: int, results: list[BatchFileResult]
+) -> None:
+    # The async session doesn't expire on commit, so receipts stay usable without a re-select.
+    for start in range(0, len(ok), max(chunk_size, 1)):
+        chunk = ok[start : start + chunk_size]
+        try:
+            receipts = await db.run_sync(
+                save_receipts, [(image_path, result) for _, image_path, result in chunk]
+            )
+        except Exception as e:
+            await db.rollback()
+            for idx, _, _ in chunk:
+                results[idx].ok = False
+                results[idx].error = f"Saving receipt failed: {e}"
+            continue
+
+        for (idx, _, _), receipt in zip(chunk, receipts):
+            results[idx].ok = True
+            results[idx].receipt_id = receipt.id
+        await run_in_threadpool(append_to_excel, receipts)
+
+
+@router.post("/batch", response_model=BatchUploadOut)
+async def upload_batch(
+    files: list[UploadFile] = File(...),
+    pipeline: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Upload many images (or ZIP archives of images) in one request.
+
+    OCR fans out across the worker pool; receipts are inserted in chunks, one
+    transaction per chunk. A bad file only fails its own entry.
+    """
 
-    # Best-effort append to Excel (local storage)
+    settings = get_settings()
+    pipeline = _check_pipeline(pipeline)
+    if await run_in_threadpool(_count_batch, files) > settings.batch_max_files:
+        raise HTTPException(status_code=413, detail=f"Too many files in batch (max {settings.batch_max_files})")
+
+    results: list[BatchFileResult] = []
+
+    pool = get_ocr_pool()
+    # Leave queue slots for other uploads while a large batch is running.
+    slots = asyncio.Semaphore(max(1, min(pool.workers, pool.queue_size)))
+    # Entries are read (and held in memory) only a little ahead of OCR, so a
+    # request costs a few uploads of memory rather than the whole batch.
+    window = asyncio.Semaphore(2 * max(1, min(pool.workers, pool.queue_size)))
+
+    async def _ocr(idx: int, content: bytes, ext: str) -> tuple[int, str, OcrResult] | None:
+        sha256 = await run_in_threadpool(content_sha256, content)
+
+        # Persist the original alongside OCR instead of before it; OCR decodes
+        # straight from the upload bytes.
+        save = asyncio.ensure_future(run_in_threadpool(store_image, content, sha256, ext))
+
+        error: str | None = None
+        result = await run_in_threadpool(ocr_cache.lookup, sha256, None, pipeline)
+        if result is None:
+            try:
+                async with slots:
+                    result = await pool.run_queued(process_image, content, None, pipeline)
+            except Exception as e:
+                error = f"OCR failed: {e}"
+            else:
+                observe_ocr_timings(result.timings)
+                await run_in_threadpool(ocr_cache.store, sha256, result, None, pipeline)
+            results[idx].timings_ms = result.timings if result is not None else None
+
+        try:
+            image_path = await save
+        except Exception as e:
+            error = error or f"Saving image failed: {e}"
+
+        if error is not None:
+            results[idx].error = error
+            return None
+        await run_in_threadpool(create_derivatives, image_path, content)
+        return idx, image_path, result
+
+    entries = _iter_batch(files, settings.max_upload_bytes, settings.max_image_pixels)
+    tasks: list[asyncio.Future] = []
     try:
-        append_receipt_to_excel(receipt, "exports/receipts.xlsx")
-    except Exception:
-        pass
-
-    return receipt
+        while True:
+            await window.acquire()
+            entry = await run_in_threadpool(next, entries, None)
+            if entry is None:
+                window.release()
+                break
+            name, content, ext, error = entry
+            results.append(BatchFileResult(filename=name, ok=False, error=error))
+            if error is not None:
+                window.release()
+                continue
+            task = asyncio.ensure_future(_ocr(len(results) - 1, content, ext))
+            task.add_done_callback(lambda _: window.release())
+            tasks.append(task)
+        ocr_done = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    ok = [x for x in ocr_done if x is not None]
+
+    await _save_batch(db, ok, settings.batch_chunk_size, results)
+
+    succeeded = sum(1 for r in results if r.ok)
+    return BatchUploadOut(
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results,
+    )
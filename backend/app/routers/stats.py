@@ -1,63 +1,105 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import func, select
+from datetime import date
+from typing import Any, Callable, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..db import get_db
-from ..models import Receipt, ReceiptItem
+from ..db import get_async_db
+from ..responses import FastJSONResponse, cache_headers, etag_matches, make_etag, not_modified
+from ..services.rollups import read_category_totals, read_item_spending
+from ..services.timeseries import default_window, spending_series
+from ..services.versions import VersionedCache, receipts_version
 
 router = APIRouter(prefix="/api/stats", tags=["stats"])
 
+# Computed bodies for the current receipts version (shared by every client)
+_cache = VersionedCache()
 
-def _group_from_receipt_category(category: str | None) -> str:
-    c = (category or "").strip().lower()
-    if not c:
-        return "Khác"
 
-    # Heuristic for demo: treat food/drink as "Ăn uống", everything else as "Mua sắm".
-    if any(k in c for k in ["ăn", "uống", "cafe", "coffee", "trà", "tea", "nhà hàng", "quán", "food"]):
-        return "Ăn uống"
+async def _versioned(
+    request: Request, db: AsyncSession, key: tuple, compute: Callable[[Session], Any]
+) -> Response:
+    # `key` identifies the body (endpoint + resolved parameters) within one data version;
+    # `compute` runs the sync stats query on the async session's connection.
+    version = await db.run_sync(receipts_version)
+    etag = make_etag(version, *key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    return "Mua sắm"
+    hit, body = _cache.lookup(version, key)
+    if not hit:
+        body = await db.run_sync(compute)
+        _cache.store(version, key, body)
+    return FastJSONResponse(body, headers=cache_headers(etag))
 
 
 @router.get("/spending-by-item")
-def spending_by_item(db: Session = Depends(get_db)):
-    rows = (
-        db.execute(
-            select(
-                ReceiptItem.item_name,
-                func.coalesce(func.sum(ReceiptItem.total_price), 0.0).label("total_spent"),
-            )
-            .group_by(ReceiptItem.item_name)
-            .order_by(func.coalesce(func.sum(ReceiptItem.total_price), 0.0).desc())
-        )
-        .all()
+async def spending_by_item(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Top items by line item spending (OCR variants of a name grouped by item key).
+
+    `date_from`/`date_to` (inclusive, receipt created_at day) narrow the window;
+    `limit`/`offset` page through the ranking.
+    """
+
+    return await _versioned(
+        request,
+        db,
+        ("spending-by-item", limit, offset, date_from, date_to),
+        lambda session: read_item_spending(session, limit, offset, date_from, date_to),
     )
 
-    return [
-        {
-            "item_name": (name or "(Không rõ)"),
-            "total_spent": float(total or 0.0),
+
+@router.get("/category-totals")
+async def category_totals(request: Request, db: AsyncSession = Depends(get_async_db)):
+    def compute(session: Session):
+        # Sum of receipt total_amount per category group, read from the daily rollup
+        totals = read_category_totals(session)
+        return {
+            "groups": [
+                {"group": k, "total": float(v)}
+                for k, v in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+            ]
         }
-        for name, total in rows
-    ]
 
+    return await _versioned(request, db, ("category-totals",), compute)
 
-@router.get("/category-totals")
-def category_totals(db: Session = Depends(get_db)):
-    # Sum by receipt category (based on receipt total_amount)
-    receipts = db.execute(select(Receipt.category, Receipt.total_amount)).all()
-
-    totals: dict[str, float] = {"Ăn uống": 0.0, "Mua sắm": 0.0, "Khác": 0.0}
-    for category, total_amount in receipts:
-        group = _group_from_receipt_category(category)
-        totals[group] = totals.get(group, 0.0) + float(total_amount or 0.0)
-
-    return {
-        "groups": [
-            {"group": k, "total": float(v)}
-            for k, v in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
-        ]
-    }
+
+@router.get("/spending/{period}")
+async def spending_over_time(
+    request: Request,
+    period: Literal["daily", "weekly", "monthly"],
+    date_from: date | None = None,
+    date_to: date | None = None,
+    category: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Receipt totals per day, week (starting Monday) or month of the purchase date.
+
+    Defaults to the last 30 days / 12 weeks / 12 months up to `date_to` (today).
+    Receipts whose date could not be read are not counted.
+    """
+
+    if date_from is None:
+        date_from, date_to = default_window(period, date_to)
+    elif date_to is None:
+        date_to = default_window(period, None)[1]
+
+    def compute(session: Session):
+        try:
+            buckets = spending_series(session, period, date_from, date_to, category)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"period": period, "date_from": date_from, "date_to": date_to, "buckets": buckets}
+
+    return await _versioned(request, db, ("spending", period, date_from, date_to, category), compute)
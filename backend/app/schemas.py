@@ -33,6 +33,7 @@ class ReceiptOut(BaseModel):
     id: int
     store_name: str | None
     date: str | None
+    purchased_at: datetime | None = None
     total_amount: float | None
     category: str | None
     image_path: str
@@ -44,3 +45,51 @@ class ReceiptDetailOut(ReceiptOut):
 
     # Line items extracted from receipt (manual/demo/AI)
     items: list[ReceiptItemOut] = []
+
+
+class JobOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    receipt_id: int | None
+    attempts: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class BatchFileResult(BaseModel):
+    filename: str
+    ok: bool
+    receipt_id: int | None = None
+    error: str | None = None
+
+    # Wall time (ms) per preprocessing stage, tesseract and extraction (absent on cache hits)
+    timings_ms: dict[str, float] | None = None
+
+
+class BatchUploadOut(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: list[BatchFileResult]
+
+
+class CategoryRuleIn(BaseModel):
+    pattern: str
+    category: str
+    priority: int = 100
+    whole_word: bool = True
+
+
+class CategoryRuleOut(CategoryRuleIn):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    updated_at: datetime
+
+
+class RecategorizeOut(BaseModel):
+    store_names: int
+    changed: int
@@ -1,30 +1,300 @@
 from __future__ import annotations
 
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
 
-RULES: list[tuple[str, str]] = [
-    ("circle k", "Ăn uống"),
-    ("highlands", "Ăn uống"),
-    ("starbucks", "Ăn uống"),
-    ("phuc long", "Ăn uống"),
-    ("co.op", "Siêu thị"),
-    ("coop", "Siêu thị"),
-    ("winmart", "Siêu thị"),
-    ("lotte", "Siêu thị"),
-    ("bach hoa xanh", "Siêu thị"),
-    ("shopee", "Mua sắm"),
-    ("lazada", "Mua sắm"),
-    ("tiki", "Mua sắm"),
-    ("grab", "Di chuyển"),
-    ("be", "Di chuyển"),
+from sqlalchemy import event, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..models import CategoryRule, Receipt
+from .rollups import CategoryDeltas, add_receipt_delta, apply_category_deltas, category_group
+from .text import fold
+from .versions import bump_version, get_version, receipts_changed
+
+
+DEFAULT_CATEGORY = "Khác"
+
+RULES_VERSION_KEY = "category_rules"
+
+# Seed rules for an empty `category_rules` table: (pattern, category, whole_word).
+# List order is priority order.
+RULES: list[tuple[str, str, bool]] = [
+    ("circle k", "Ăn uống", False),
+    ("highlands", "Ăn uống", False),
+    ("starbucks", "Ăn uống", False),
+    ("phuc long", "Ăn uống", False),
+    ("co.op", "Siêu thị", False),
+    ("coop", "Siêu thị", False),
+    ("winmart", "Siêu thị", False),
+    ("lotte", "Siêu thị", False),
+    ("bach hoa xanh", "Siêu thị", False),
+    ("shopee", "Mua sắm", False),
+    ("lazada", "Mua sắm", False),
+    ("tiki", "Mua sắm", False),
+    ("grab", "Di chuyển", False),
+    ("be", "Di chuyển", True),
 ]
 
 
+@dataclass(frozen=True)
+class RuleSpec:
+    pattern: str
+    category: str
+    priority: int = 100
+    whole_word: bool = True
+    rule_id: int = 0
+
+
+class CategoryMatcher:
+    """Aho-Corasick automaton over all rule patterns.
+
+    One scan of the store name finds every matching pattern, so the cost does
+    not grow with the number of rules.
+    """
+
+    def __init__(self, rules: Iterable[RuleSpec]):
+        self.rules = sorted(
+            (r for r in rules if fold(r.pattern)),
+            key=lambda r: (r.priority, r.rule_id),
+        )
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Per state: (rule rank, pattern length) of every pattern ending there
+        self._out: list[list[tuple[int, int]]] = [[]]
+
+        for rank, rule in enumerate(self.rules):
+            pattern = fold(rule.pattern)
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((rank, len(pattern)))
+
+        # Breadth-first failure links; outputs of the fallback state are inherited.
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def match(self, text: str | None) -> RuleSpec | None:
+        if not text or not self.rules:
+            return None
+
+        folded = fold(text)
+        best: int | None = None
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for rank, length in self._out[state]:
+                if best is not None and rank >= best:
+                    continue
+                if self.rules[rank].whole_word:
+                    start = i - length + 1
+                    if start > 0 and folded[start - 1].isalnum():
+                        continue
+                    if i + 1 < len(folded) and folded[i + 1].isalnum():
+                        continue
+                best = rank
+        return self.rules[best] if best is not None else None
+
+    def categorize(self, store_name: str | None) -> str:
+        rule = self.match(store_name)
+        return rule.category if rule else DEFAULT_CATEGORY
+
+
+_DEFAULT_MATCHER = CategoryMatcher(
+    RuleSpec(pattern, category, priority=i, whole_word=whole_word)
+    for i, (pattern, category, whole_word) in enumerate(RULES)
+)
+
+
+def load_rules(db: Session) -> list[RuleSpec]:
+    rows = db.execute(
+        select(
+            CategoryRule.id,
+            CategoryRule.pattern,
+            CategoryRule.category,
+            CategoryRule.priority,
+            CategoryRule.whole_word,
+        )
+    ).all()
+    return [
+        RuleSpec(pattern, category, priority=priority, whole_word=whole_word, rule_id=rule_id)
+        for rule_id, pattern, category, priority, whole_word in rows
+    ]
+
+
+class _MatcherCache:
+    """Compiled matcher for the current rule set, rebuilt when its version changes.
+
+    The version row is checked at most every CATEGORY_RELOAD_INTERVAL seconds,
+    so edits made by any process are picked up without a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matcher: CategoryMatcher | None = None
+        self._version: int | None = None
+        self._checked_at = 0.0
+        self._pinned = False
+
+    def pin(self, matcher: CategoryMatcher) -> None:
+        with self._lock:
+            self._matcher = matcher
+            self._pinned = True
+
+    def _fresh(self, refresh: bool) -> bool:
+        if self._matcher is None:
+            return False
+        if self._pinned:
+            return True
+        interval = get_settings().category_reload_interval
+        return not refresh and time.monotonic() - self._checked_at < interval
+
+    def get(self, db: Session | None = None, refresh: bool = False) -> CategoryMatcher:
+        if self._fresh(refresh):
+            return self._matcher
+
+        with self._lock:
+            if self._fresh(refresh):
+                return self._matcher
+            try:
+                self._reload(db)
+            except Exception:
+                # DB unreachable / table missing: keep the last good matcher (or the seed rules).
+                if self._matcher is None:
+                    self._matcher = _DEFAULT_MATCHER
+            self._checked_at = time.monotonic()
+            return self._matcher
+
+    def _reload(self, db: Session | None) -> None:
+        if db is None:
+            from ..db import SessionLocal
+
+            with SessionLocal() as own:
+                return self._reload(own)
+
+        version = get_version(db, RULES_VERSION_KEY)
+        if self._matcher is not None and version == self._version:
+            return
+        rules = load_rules(db)
+        self._matcher = CategoryMatcher(rules) if rules else _DEFAULT_MATCHER
+        self._version = version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._checked_at = 0.0
+
+
+_cache = _MatcherCache()
+
+
+def get_matcher(db: Session | None = None, refresh: bool = False) -> CategoryMatcher:
+    """Cached matcher; `refresh` checks the rule version now instead of after the interval."""
+
+    return _cache.get(db, refresh)
+
+
+def pin_matcher(rules: list[RuleSpec]) -> None:
+    """Use a fixed rule set in this process (e.g. pool workers, which get it from the parent)."""
+
+    _cache.pin(CategoryMatcher(rules) if rules else _DEFAULT_MATCHER)
+
+
+def rules_changed(db: Session) -> None:
+    """Call in the transaction that edits `category_rules`."""
+
+    bump_version(db, RULES_VERSION_KEY)
+    # This process sees its own edit right after commit; others within the reload interval.
+    event.listen(db, "after_commit", lambda session: _cache.invalidate(), once=True)
+
+
+def seed_rules(db: Session) -> int:
+    """Insert the built-in RULES when the table is empty. Returns rows inserted."""
+
+    if db.scalar(select(func.count(CategoryRule.id))):
+        return 0
+    db.add_all(
+        CategoryRule(pattern=pattern, category=category, priority=i, whole_word=whole_word)
+        for i, (pattern, category, whole_word) in enumerate(RULES)
+    )
+    rules_changed(db)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another process seeded concurrently.
+        db.rollback()
+        return 0
+    return len(RULES)
+
+
 def categorize(store_name: str | None) -> str:
     if not store_name:
-        return "Khác"
+        return DEFAULT_CATEGORY
+    return get_matcher().categorize(store_name)
+
+
+def recategorize_all(db: Session, batch_size: int = 500) -> dict[str, int]:
+    """Re-apply the current rules to every receipt.
+
+    Works on distinct store names (one UPDATE per name whose category changes),
+    not on individual receipts.
+    """
+
+    matcher = get_matcher(db, refresh=True)
+    names = db.execute(select(Receipt.store_name).distinct()).scalars().all()
+
+    changed = 0
+    for start in range(0, len(names), batch_size):
+        batch_changed = 0
+        deltas: CategoryDeltas = {}
+        for name in names[start : start + batch_size]:
+            category = matcher.categorize(name)
+            group = category_group(category)
+            store_filter = Receipt.store_name == name if name is not None else Receipt.store_name.is_(None)
+            category_changed = (Receipt.category != category) | Receipt.category.is_(None)
+
+            # Rollup: move the amounts of receipts that change group.
+            day = func.date(Receipt.created_at)
+            moved = db.execute(
+                select(Receipt.category_group, day, func.sum(Receipt.total_amount), func.count(Receipt.id))
+                .where(store_filter)
+                .where(category_changed)
+                .where((Receipt.category_group != group) | Receipt.category_group.is_(None))
+                .group_by(Receipt.category_group, day)
+            ).all()
+            for old_group, d, total, count in moved:
+                add_receipt_delta(deltas, old_group, d, -(total or 0.0), count=-count)
+                add_receipt_delta(deltas, group, d, total, count=count)
+
+            result = db.execute(
+                update(Receipt)
+                .where(store_filter)
+                .where(category_changed)
+                .values(category=category, category_group=group)
+            )
+            batch_changed += result.rowcount or 0
+        apply_category_deltas(db, deltas)
+        if batch_changed:
+            receipts_changed(db)
+        db.commit()
+        changed += batch_changed
 
-    normalized = store_name.strip().lower()
-    for needle, category in RULES:
-        if needle in normalized:
-            return category
-    return "Khác"
+    return {"store_names": len(names), "changed": changed}
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import json
+import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from typing import IO, Iterator
 
 from openpyxl import Workbook, load_workbook
 
@@ -25,37 +30,216 @@ def _ensure_export_path(export_path: str) -> Path:
     return p
 
 
-def append_receipt_to_excel(receipt: Receipt, export_path: str) -> str:
-    path = _ensure_export_path(export_path)
+def journal_path(export_path: str) -> Path:
+    return Path(export_path).with_suffix(".journal.ndjson")
 
-    if path.exists():
-        wb = load_workbook(path)
-        ws = wb.active
-        if ws.max_row < 1:
-            ws.append(HEADER)
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "receipts"
-        ws.append(HEADER)
 
+def _pending_path(export_path: str) -> Path:
+    # Journal taken over by a compaction (kept until the workbook is replaced).
+    return Path(export_path).with_suffix(".journal.compacting.ndjson")
+
+
+def _compact_lock_path(export_path: str) -> Path:
+    return Path(export_path).with_suffix(".compact.lock")
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(fh: IO, blocking: bool = True) -> bool:
+        fh.seek(0)
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _unlock_file(fh: IO) -> None:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(fh: IO, blocking: bool = True) -> bool:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def _unlock_file(fh: IO) -> None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked_journal(path: Path) -> Iterator[IO]:
+    """Open the journal for appending under an exclusive lock.
+
+    A compaction may rename the journal while we wait for the lock; in that
+    case the handle points at the old file, so reopen the current one.
+    """
+
+    while True:
+        fh = open(path, "a", encoding="utf-8")
+        _lock_file(fh)
+        try:
+            same = os.path.exists(path) and os.path.samestat(os.fstat(fh.fileno()), os.stat(path))
+        except OSError:
+            same = False
+        if same:
+            break
+        _unlock_file(fh)
+        fh.close()
+
+    try:
+        yield fh
+    finally:
+        fh.flush()
+        _unlock_file(fh)
+        fh.close()
+
+
+def _row(receipt: Receipt) -> list:
     created_at = receipt.created_at
     if isinstance(created_at, datetime):
         created_at_str = created_at.isoformat()
     else:
         created_at_str = str(created_at)
 
-    ws.append(
-        [
-            receipt.id,
-            receipt.store_name,
-            receipt.date,
-            receipt.total_amount,
-            receipt.category,
-            receipt.image_path,
-            created_at_str,
-        ]
-    )
-
-    wb.save(path)
+    return [
+        receipt.id,
+        receipt.store_name,
+        receipt.date,
+        receipt.total_amount,
+        receipt.category,
+        receipt.image_path,
+        created_at_str,
+    ]
+
+
+def append_receipts_to_excel(receipts: list[Receipt], export_path: str) -> str:
+    """Record receipts for the Excel file by appending them to its journal.
+
+    Cost does not depend on the workbook size; rows reach the .xlsx on the
+    next `compact_journal`.
+    """
+
+    path = journal_path(str(_ensure_export_path(export_path)))
+    payload = "".join(json.dumps(_row(r), ensure_ascii=False) + "\n" for r in receipts)
+    if payload:
+        with _locked_journal(path) as fh:
+            fh.write(payload)
     return str(path)
+
+
+def append_receipt_to_excel(receipt: Receipt, export_path: str) -> str:
+    return append_receipts_to_excel([receipt], export_path)
+
+
+def _read_journal(path: Path) -> list[list]:
+    rows: list[list] = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # Torn last line after a crash mid-write.
+                continue
+    return rows
+
+
+def compact_journal(export_path: str) -> int:
+    """Fold journaled rows into the workbook; returns the number of rows added.
+
+    Only one process compacts at a time (non-blocking lock file; a busy lock
+    returns 0). The workbook is rewritten once per compaction in openpyxl's
+    streaming modes and swapped in with os.replace, so readers never see a
+    partial file.
+    """
+
+    path = _ensure_export_path(export_path)
+    journal = journal_path(export_path)
+    pending = _pending_path(export_path)
+
+    with open(_compact_lock_path(export_path), "a") as lock:
+        if not _lock_file(lock, blocking=False):
+            return 0
+        try:
+            # Take over the journal; new appends start a fresh file. A pending file
+            # left by an interrupted compaction is finished first.
+            if not pending.exists():
+                if not journal.exists():
+                    return 0
+                with _locked_journal(journal):
+                    os.replace(journal, pending)
+
+            rows = _read_journal(pending)
+            new_ids = {r[0] for r in rows}
+
+            tmp = path.with_suffix(".compacting.xlsx")
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("receipts")
+            ws.append(HEADER)
+
+            if path.exists():
+                src = load_workbook(path, read_only=True)
+                try:
+                    for i, values in enumerate(src.active.iter_rows(values_only=True)):
+                        if i == 0 and list(values[: len(HEADER)]) == HEADER:
+                            continue
+                        if values and values[0] in new_ids:
+                            # Already written by a compaction that crashed before cleanup.
+                            new_ids.discard(values[0])
+                        ws.append(list(values))
+                finally:
+                    src.close()
+
+            added = 0
+            for row in rows:
+                if row[0] in new_ids:
+                    ws.append(row)
+                    new_ids.discard(row[0])
+                    added += 1
+
+            wb.save(tmp)
+            os.replace(tmp, path)
+            pending.unlink(missing_ok=True)
+            return added
+        finally:
+            _unlock_file(lock)
+
+
+class ExcelCompactor:
+    """Background thread that periodically compacts the Excel journal."""
+
+    def __init__(self, export_path: str, interval: float):
+        self.export_path = export_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="excel-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Flush what was journaled since the last round.
+        self._compact()
+
+    def _compact(self) -> None:
+        try:
+            compact_journal(self.export_path)
+        except Exception:
+            # Best-effort like the export itself; the journal is kept for the next round.
+            pass
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._compact()
@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+from openpyxl import Workbook
+from sqlalchemy import Row, Select, select
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..models import Receipt, ReceiptItem
+from .versions import RECEIPTS_VERSION_KEY, get_version
+
+
+RECEIPT_COLUMNS = [
+    "id",
+    "store_name",
+    "date",
+    "total_amount",
+    "category",
+    "image_path",
+    "created_at",
+]
+
+ITEM_COLUMNS = [
+    "receipt_id",
+    "item_name",
+    "quantity",
+    "unit_price",
+    "total_price",
+    "item_id",
+]
+
+JOINED_ITEM_COLUMNS = ["item_id", "item_name", "quantity", "unit_price", "total_price"]
+
+EXPORT_FORMATS = ("xlsx", "csv", "ndjson", "parquet")
+EXPORT_LAYOUTS = ("joined", "files")
+
+
+class ExportUnavailable(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    category: str | None = None
+    # Case-insensitive substring of the store name
+    store: str | None = None
+    # Only receipts with id > since_id (incremental pulls)
+    since_id: int | None = None
+    min_total: float | None = None
+    max_total: float | None = None
+
+    @property
+    def empty(self) -> bool:
+        return all(v is None for v in vars(self).values())
+
+    def apply(self, query: Select) -> Select:
+        if self.created_from is not None:
+            query = query.where(Receipt.created_at >= self.created_from)
+        if self.created_to is not None:
+            query = query.where(Receipt.created_at < self.created_to)
+        if self.category is not None:
+            query = query.where(Receipt.category == self.category)
+        if self.store:
+            escaped = self.store.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.where(Receipt.store_name.ilike(f"%{escaped}%", escape="\\"))
+        if self.since_id is not None:
+            query = query.where(Receipt.id > self.since_id)
+        if self.min_total is not None:
+            query = query.where(Receipt.total_amount >= self.min_total)
+        if self.max_total is not None:
+            query = query.where(Receipt.total_amount <= self.max_total)
+        return query
+
+
+def iter_receipt_chunks(
+    db: Session, chunk_size: int, filters: ExportFilter | None = None
+) -> Iterator[Sequence[Row]]:
+    """Receipts newest first, `chunk_size` rows per query.
+
+    Keyset-paginated on the primary key (ids grow with created_at), so every
+    chunk is an index range scan however deep into the table it is.
+    """
+
+    last_id: int | None = None
+    while True:
+        query = (
+            select(
+                Receipt.id,
+                Receipt.store_name,
+                Receipt.date,
+                Receipt.total_amount,
+                Receipt.category,
+                Receipt.image_path,
+                Receipt.created_at,
+            )
+            .order_by(Receipt.id.desc())
+            .limit(chunk_size)
+        )
+        if last_id is not None:
+            query = query.where(Receipt.id < last_id)
+        if filters is not None:
+            query = filters.apply(query)
+        rows = db.execute(query).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def items_by_receipt(db: Session, receipt_ids: list[int]) -> dict[int, list[Row]]:
+    out: dict[int, list[Row]] = {}
+    rows = db.execute(
+        select(
+            ReceiptItem.id,
+            ReceiptItem.receipt_id,
+            ReceiptItem.item_name,
+            ReceiptItem.quantity,
+            ReceiptItem.unit_price,
+            ReceiptItem.total_price,
+        )
+        .where(ReceiptItem.receipt_id.in_(receipt_ids))
+        .order_by(ReceiptItem.receipt_id, ReceiptItem.id)
+    )
+    for row in rows:
+        out.setdefault(row.receipt_id, []).append(row)
+    return out
+
+
+def write_receipts_xlsx(
+    db: Session, dest: Path, chunk_size: int = 1000, filters: ExportFilter | None = None
+) -> int:
+    """Stream every receipt (sheet "receipts") and its items (sheet "items") into `dest`.
+
+    Uses openpyxl's write-only mode, so memory stays flat whatever the row count.
+    Returns the number of receipts written.
+    """
+
+    wb = Workbook(write_only=True)
+    ws_receipts = wb.create_sheet("receipts")
+    ws_receipts.append(RECEIPT_COLUMNS)
+    ws_items = wb.create_sheet("items")
+    ws_items.append(ITEM_COLUMNS)
+
+    count = 0
+    for rows in iter_receipt_chunks(db, chunk_size, filters):
+        items = items_by_receipt(db, [r.id for r in rows])
+        for r in rows:
+            ws_receipts.append(
+                [
+                    r.id,
+                    r.store_name,
+                    r.date,
+                    r.total_amount,
+                    r.category,
+                    r.image_path,
+                    r.created_at.isoformat() if r.created_at else None,
+                ]
+            )
+            for it in items.get(r.id, ()):
+                ws_items.append([r.id, it.item_name, it.quantity, it.unit_price, it.total_price, it.id])
+        count += len(rows)
+
+    wb.save(dest)
+    return count
+
+
+_build_lock = threading.Lock()
+
+
+def _prune(cache_dir: Path, keep: Path) -> None:
+    for old in cache_dir.glob("receipts-v*.xlsx"):
+        if old != keep:
+            try:
+                old.unlink()
+            except OSError:
+                # Still being downloaded (Windows); removed next time.
+                pass
+
+
+def cached_export(db: Session) -> Path:
+    """Path of the .xlsx export for the current receipts version, built if missing.
+
+    The version and the rows are read in the same transaction, so the file
+    matches the version it is named after. Each build writes to its own temp
+    file and is renamed into place; downloads of an unchanged data set reuse it.
+    """
+
+    settings = get_settings()
+    cache_dir = Path(settings.export_cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    version = get_version(db, RECEIPTS_VERSION_KEY)
+    path = cache_dir / f"receipts-v{version}.xlsx"
+    if path.exists():
+        return path
+
+    with _build_lock:
+        if path.exists():
+            return path
+        fd, tmp = tempfile.mkstemp(prefix="receipts-", suffix=".xlsx.tmp", dir=cache_dir)
+        os.close(fd)
+        try:
+            write_receipts_xlsx(db, Path(tmp), settings.export_chunk_size)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        _prune(cache_dir, keep=path)
+    return path
+
+
+def build_export_file(db: Session, filters: ExportFilter) -> Path:
+    """Filtered .xlsx export in a fresh temp file (not cached); the caller deletes it."""
+
+    settings = get_settings()
+    cache_dir = Path(settings.export_cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix="receipts-filtered-", suffix=".xlsx", dir=cache_dir)
+    os.close(fd)
+    try:
+        write_receipts_xlsx(db, Path(tmp), settings.export_chunk_size, filters)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return Path(tmp)
+
+
+# --- Streaming exports (csv / ndjson / parquet) -----------------------------------
+
+
+def _receipts_query(filters: ExportFilter) -> Select:
+    query = select(
+        Receipt.id,
+        Receipt.store_name,
+        Receipt.date,
+        Receipt.total_amount,
+        Receipt.category,
+        Receipt.image_path,
+        Receipt.created_at,
+    ).order_by(Receipt.id)
+    return filters.apply(query)
+
+
+def _items_query(filters: ExportFilter) -> Select:
+    query = (
+        select(
+            ReceiptItem.receipt_id,
+            ReceiptItem.item_name,
+            ReceiptItem.quantity,
+            ReceiptItem.unit_price,
+            ReceiptItem.total_price,
+            ReceiptItem.id,
+        )
+        .join(Receipt, Receipt.id == ReceiptItem.receipt_id)
+        .order_by(ReceiptItem.receipt_id, ReceiptItem.id)
+    )
+    return filters.apply(query)
+
+
+def _joined_query(filters: ExportFilter) -> Select:
+    # One row per item; receipts without items get a single row with empty item columns.
+    query = (
+        select(
+            Receipt.id,
+            Receipt.store_name,
+            Receipt.date,
+            Receipt.total_amount,
+            Receipt.category,
+            Receipt.image_path,
+            Receipt.created_at,
+            ReceiptItem.id,
+            ReceiptItem.item_name,
+            ReceiptItem.quantity,
+            ReceiptItem.unit_price,
+            ReceiptItem.total_price,
+        )
+        .outerjoin(ReceiptItem, ReceiptItem.receipt_id == Receipt.id)
+        .order_by(Receipt.id, ReceiptItem.id)
+    )
+    return filters.apply(query)
+
+
+def _stream_rows(db: Session, query: Select, chunk_size: int) -> Iterator[list[tuple]]:
+    # yield_per streams from a server-side cursor where the driver supports it.
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_chunks(columns: list[str], partitions: Iterable[list[tuple]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows([_plain(v) for v in row] for row in rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(columns: list[str], partitions: Iterable[list[tuple]]) -> Iterator[bytes]:
+    for rows in partitions:
+        yield "".join(
+            json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+def _nested_ndjson_chunks(partitions: Iterable[list[tuple]]) -> Iterator[bytes]:
+    """Joined rows (ordered by receipt) -> one JSON object per receipt with an `items` list."""
+
+    n = len(RECEIPT_COLUMNS)
+    current: dict | None = None
+    for rows in partitions:
+        out: list[str] = []
+        for row in rows:
+            if current is None or current["id"] != row[0]:
+                if current is not None:
+                    out.append(json.dumps(current, ensure_ascii=False) + "\n")
+                current = {c: _plain(v) for c, v in zip(RECEIPT_COLUMNS, row[:n])}
+                current["items"] = []
+            if row[n] is not None:
+                current["items"].append(dict(zip(["id", *JOINED_ITEM_COLUMNS[1:]], row[n:])))
+        if out:
+            yield "".join(out).encode("utf-8")
+    if current is not None:
+        yield (json.dumps(current, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _Sink:
+    """Write-only file object that hands written bytes back to the response stream."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # No seek(): zipfile then writes data descriptors instead of seeking back.
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+_ARROW_TYPES = {
+    "id": "int64",
+    "receipt_id": "int64",
+    "item_id": "int64",
+    "quantity": "float64",
+    "unit_price": "float64",
+    "total_price": "float64",
+    "total_amount": "float64",
+    "created_at": "timestamp",
+}
+
+
+def _parquet_chunks(columns: list[str], partitions: Iterable[list[tuple]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def arrow_type(name: str):
+        kind = _ARROW_TYPES.get(name, "string")
+        return pa.timestamp("us") if kind == "timestamp" else pa.type_for_alias(kind)
+
+    schema = pa.schema([(c, arrow_type(c)) for c in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in partitions:
+            # One row group per DB partition.
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_TABLE_WRITERS: dict[str, Callable[[list[str], Iterable[list[tuple]]], Iterator[bytes]]] = {
+    "csv": _csv_chunks,
+    "ndjson": _ndjson_chunks,
+    "parquet": _parquet_chunks,
+}
+
+
+def _zip_chunks(files: list[tuple[str, Iterator[bytes]]]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, chunks in files:
+            with zf.open(name, mode="w", force_zip64=True) as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def check_format(fmt: str, layout: str) -> None:
+    """Raise ValueError for unknown options, ExportUnavailable when a writer is missing."""
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Available: {', '.join(EXPORT_FORMATS)}")
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}'. Available: {', '.join(EXPORT_LAYOUTS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ExportUnavailable("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+def stream_export(
+    fmt: str,
+    layout: str,
+    filters: ExportFilter,
+    session_factory: Callable[[], Session],
+    chunk_size: int = 1000,
+) -> Iterator[bytes]:
+    """Bytes of a csv/ndjson/parquet export, produced while rows come off the cursor.
+
+    layout "joined": one file (flat receipt+item rows; for ndjson one object per
+    receipt with nested items). layout "files": a zip with receipts.<ext> and
+    items.<ext>. Opens its own session, since it outlives the request handler.
+    """
+
+    with session_factory() as db:
+        if layout == "joined":
+            rows = _stream_rows(db, _joined_query(filters), chunk_size)
+            if fmt == "ndjson":
+                yield from _nested_ndjson_chunks(rows)
+            else:
+                yield from _TABLE_WRITERS[fmt](RECEIPT_COLUMNS + JOINED_ITEM_COLUMNS, rows)
+            return
+
+        # Queries run one after the other: a streaming cursor owns the connection.
+        write = _TABLE_WRITERS[fmt]
+        yield from _zip_chunks(
+            [
+                (f"receipts.{fmt}", write(RECEIPT_COLUMNS, _stream_rows(db, _receipts_query(filters), chunk_size))),
+                (f"items.{fmt}", write(ITEM_COLUMNS, _stream_rows(db, _items_query(filters), chunk_size))),
+            ]
+        )
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
+from datetime import datetime
 
 
 @dataclass(frozen=True)
@@ -45,6 +46,44 @@ _ADDRESS_HINT_RE = re.compile(
 )
 
 
+_SEPARATOR_RE = re.compile(r"[\-_=*~.]{3,}")
+_NOISE_CHARS_RE = re.compile(r"[^0-9A-Za-zÀ-ỹ&()\-.,:/+%#' ]+")
+_SPACES_RE = re.compile(r"\s+")
+_TABS_RE = re.compile(r"[\t\r]+")
+
+
+def _is_low_signal(line: str) -> bool:
+    # Very low-signal lines (common OCR garbage like "TT Se ee EL")
+    if len(line) < 6:
+        return False
+    alnum = sum(1 for ch in line if ch.isalnum())
+    letters = sum(1 for ch in line if ch.isalpha())
+    ratio = alnum / max(len(line), 1)
+    tokens = line.split()
+    has_long_token = any(len(t) >= 4 for t in tokens)
+    short_token_ratio = (
+        sum(1 for t in tokens if len(t) <= 2) / max(len(tokens), 1)
+    )
+    return (letters < 3 and ratio < 0.5) or (not has_long_token and short_token_ratio > 0.7)
+
+
+def _clean_line(raw_line: str) -> str | None:
+    line = raw_line.strip()
+    if not line:
+        return None
+
+    # Drop separator lines like "-----" or "====="
+    if _SEPARATOR_RE.fullmatch(line):
+        return None
+
+    # Keep letters/digits (incl. Vietnamese), spaces, and a small set of punctuation.
+    line = _NOISE_CHARS_RE.sub(" ", line)
+    line = _SPACES_RE.sub(" ", line).strip()
+    if not line or _is_low_signal(line):
+        return None
+    return line
+
+
 def clean_ocr_text(text: str) -> str:
     """Normalize OCR output for downstream extraction/display.
 
@@ -53,86 +92,141 @@ def clean_ocr_text(text: str) -> str:
     - Collapses whitespace
     """
 
-    text = _normalize_text(text)
+    cleaned_lines = (_clean_line(ln) for ln in _normalize_text(text).split("\n"))
+    return "\n".join(ln for ln in cleaned_lines if ln)
 
-    cleaned_lines: list[str] = []
-    for raw_line in text.split("\n"):
-        line = raw_line.strip()
-        if not line:
-            continue
 
-        # Drop separator lines like "-----" or "====="
-        if re.fullmatch(r"[\-_=*~.]{3,}", line):
-            continue
+def _normalize_text(text: str) -> str:
+    text = text.replace("\u00a0", " ")
+    text = _TABS_RE.sub(" ", text)
+    return text
 
-        # Keep letters/digits (incl. Vietnamese), spaces, and a small set of punctuation.
-        line = re.sub(r"[^0-9A-Za-zÀ-ỹ&()\-.,:/+%#' ]+", " ", line)
-        line = re.sub(r"\s+", " ", line).strip()
-        if not line:
-            continue
 
-        # Drop very low-signal lines (common OCR garbage like "TT Se ee EL")
-        alnum = sum(1 for ch in line if ch.isalnum())
-        letters = sum(1 for ch in line if ch.isalpha())
-        if len(line) >= 6:
-            ratio = alnum / max(len(line), 1)
-            tokens = line.split()
-            has_long_token = any(len(t) >= 4 for t in tokens)
-            short_token_ratio = (
-                sum(1 for t in tokens if len(t) <= 2) / max(len(tokens), 1)
-            )
-            if (letters < 3 and ratio < 0.5) or (not has_long_token and short_token_ratio > 0.7):
-                continue
+_MONEY_RE = re.compile(r"\d[\d., ]{2,}")
 
-        cleaned_lines.append(line)
 
-    return "\n".join(cleaned_lines)
+@dataclass(frozen=True)
+class DocumentLine:
+    text: str
+    lower: str
+    tokens: tuple[str, ...]
+    # Parsed money candidates on the line, left to right
+    amounts: tuple[float, ...]
 
 
-def _normalize_text(text: str) -> str:
-    text = text.replace("\u00a0", " ")
-    text = re.sub(r"[\t\r]+", " ", text)
-    return text
+@dataclass(frozen=True)
+class ParsedDocument:
+    """OCR text cleaned and tokenized once; every extractor reads from this."""
 
+    # Cleaned text (what is stored as the receipt's raw_text)
+    text: str
+    lines: tuple[DocumentLine, ...]
 
-def extract_store_name(text: str) -> str | None:
-    text = clean_ocr_text(text)
-    lines = [ln.strip() for ln in text.split("\n") if ln.strip()]
-    if not lines:
+
+def parse_document(text: str) -> ParsedDocument:
+    cleaned: list[str] = []
+    lines: list[DocumentLine] = []
+    for raw_line in _normalize_text(text).split("\n"):
+        line = _clean_line(raw_line)
+        if not line:
+            continue
+        cleaned.append(line)
+        # Noise removal can leave a bare separator ("*** ---" -> "---"); extraction
+        # has always seen the text cleaned a second time, which drops those.
+        if _SEPARATOR_RE.fullmatch(line):
+            continue
+        amounts = (_parse_money_token(t) for t in _MONEY_RE.findall(line))
+        lines.append(
+            DocumentLine(
+                text=line,
+                lower=line.lower(),
+                tokens=tuple(line.split()),
+                amounts=tuple(v for v in amounts if v is not None),
+            )
+        )
+    return ParsedDocument(text="\n".join(cleaned), lines=tuple(lines))
+
+
+def _as_document(text: str | ParsedDocument) -> ParsedDocument:
+    return text if isinstance(text, ParsedDocument) else parse_document(text)
+
+
+def extract_store_name(text: str | ParsedDocument) -> str | None:
+    doc = _as_document(text)
+    if not doc.lines:
         return None
 
     # Business rule (per app UX): store name is always the first line on the receipt.
     # We intentionally ignore address/phone lines that usually follow.
-    return lines[0][:255]
+    return doc.lines[0].text[:255]
 
 
-def extract_date(text: str) -> str | None:
-    normalized = clean_ocr_text(text)
+def extract_date(text: str | ParsedDocument) -> str | None:
+    doc = _as_document(text)
 
     # Prefer explicit labeled date (e.g. "Date: 02/09/2026 14:45" or "Ngày: ...").
-    for ln in (s.strip() for s in normalized.split("\n")):
-        if not ln:
-            continue
-        m = _DATE_LABELED_RE.search(ln)
+    for ln in doc.lines:
+        m = _DATE_LABELED_RE.search(ln.text)
         if m:
             d = m.group(2)
             t = m.group(3)
             return f"{d} {t}".strip() if t else d
 
     for pattern in _DATE_PATTERNS:
-        m = pattern.search(normalized)
-        if m:
-            return m.group(1)
+        for ln in doc.lines:
+            m = pattern.search(ln.text)
+            if m:
+                return m.group(1)
+    return None
+
+
+_DATE_VALUE_RE = re.compile(
+    r"^\s*(?:(\d{1,2})[/-](\d{1,2})[/-](\d{4})|(\d{4})[/-](\d{1,2})[/-](\d{1,2}))(?:\s+(\d{1,2}):(\d{2}))?"
+)
+
+
+def parse_receipt_date(value: str | None) -> datetime | None:
+    """Parse an `extract_date` string ("dd/mm/yyyy hh:mm", "yyyy-mm-dd", ...).
+
+    Day-first like Vietnamese receipts; month-first only when day-first is not
+    a valid date. None when unparseable or outside 2000-2099.
+    """
+
+    if not value:
+        return None
+    m = _DATE_VALUE_RE.match(value)
+    if not m:
+        return None
+
+    if m.group(3):
+        year = int(m.group(3))
+        a, b = int(m.group(1)), int(m.group(2))
+        candidates = [(b, a), (a, b)]  # (month, day)
+    else:
+        year = int(m.group(4))
+        candidates = [(int(m.group(5)), int(m.group(6)))]
+    hour, minute = (int(m.group(7)), int(m.group(8))) if m.group(7) else (0, 0)
+    if not 2000 <= year <= 2099:
+        return None
+
+    for month, day in candidates:
+        try:
+            return datetime(year, month, day, hour, minute)
+        except ValueError:
+            continue
     return None
 
 
+_LATIN_LETTER_RE = re.compile(r"[A-Za-z]")
+
+
 def _parse_quantity_token(token: str) -> float | None:
     token = token.strip()
     if not token:
         return None
     # Reject tokens that look like money (contain separators like ',' '.' in a long digit group)
     # but accept simple integer/float quantities.
-    if re.search(r"[A-Za-z]", token):
+    if _LATIN_LETTER_RE.search(token):
         return None
     token = token.replace(",", ".")
     try:
@@ -151,8 +245,18 @@ _ITEM_STOP_RE = re.compile(
     re.I,
 )
 
+_ITEM_HEADER_RE = re.compile(r"\b(item|tên)\b.*\b(qty|sl|s\.?l\.?|quantity)\b", re.I)
 
-def extract_line_items(text: str) -> list[ExtractedLineItem]:
+# name + qty + unit + total (numbers at line end)
+_ITEM_STRICT_RE = re.compile(
+    r"^(?P<name>.+?)\s+(?P<qty>\d+(?:[\.,]\d+)?)\s+(?P<unit>[\d., ]{2,})\s+(?P<tot>[\d., ]{2,})(?:\s*(?:vnd|đ|d))?$",
+    re.I,
+)
+
+_CURRENCY_SUFFIX_RE = re.compile(r"(vnd|đ)$", re.I)
+
+
+def extract_line_items(text: str | ParsedDocument) -> list[ExtractedLineItem]:
     """Extract line items from OCR text using lightweight heuristics.
 
     Supports common receipt layouts like:
@@ -160,15 +264,13 @@ def extract_line_items(text: str) -> list[ExtractedLineItem]:
       T-SHIRT ... 1 250,000 250,000
     """
 
-    normalized = clean_ocr_text(text)
-    lines = [ln.strip() for ln in normalized.split("\n") if ln.strip()]
+    lines = _as_document(text).lines
     if not lines:
         return []
 
     header_idx: int | None = None
-    header_re = re.compile(r"\b(item|tên)\b.*\b(qty|sl|s\.?l\.?|quantity)\b", re.I)
     for i, ln in enumerate(lines[:80]):
-        if header_re.search(ln):
+        if _ITEM_HEADER_RE.search(ln.text):
             header_idx = i
             break
 
@@ -178,7 +280,8 @@ def extract_line_items(text: str) -> list[ExtractedLineItem]:
     extracted: list[ExtractedLineItem] = []
 
     # Most receipts have items before SUBTOTAL/TOTAL blocks.
-    for ln in candidates:
+    for line in candidates:
+        ln = line.text
         if _ITEM_STOP_RE.search(ln):
             if extracted:
                 break
@@ -187,15 +290,11 @@ def extract_line_items(text: str) -> list[ExtractedLineItem]:
         # Skip obvious non-item lines.
         if _STORE_STOPWORDS_RE.search(ln):
             continue
-        if ln.lower() in {"item", "items", "qty", "price", "total"}:
+        if line.lower in {"item", "items", "qty", "price", "total"}:
             continue
 
         # Try strict pattern first: name + qty + unit + total (numbers at line end)
-        m = re.match(
-            r"^(?P<name>.+?)\s+(?P<qty>\d+(?:[\.,]\d+)?)\s+(?P<unit>[\d., ]{2,})\s+(?P<tot>[\d., ]{2,})(?:\s*(?:vnd|đ|d))?$",
-            ln,
-            flags=re.I,
-        )
+        m = _ITEM_STRICT_RE.match(ln)
         if m:
             name = m.group("name").strip()[:255]
             qty = _parse_quantity_token(m.group("qty"))
@@ -218,15 +317,11 @@ def extract_line_items(text: str) -> list[ExtractedLineItem]:
             continue
 
         # Heuristic fallback: parse from right-most numeric tokens.
-        tokens = ln.split()
-        if len(tokens) < 3:
+        if len(line.tokens) < 3:
             continue
 
         # Strip common currency suffixes on last token.
-        stripped_tokens: list[str] = []
-        for t in tokens:
-            stripped_tokens.append(re.sub(r"(?i)(vnd|đ)$", "", t))
-        tokens = stripped_tokens
+        tokens = [_CURRENCY_SUFFIX_RE.sub("", t) for t in line.tokens]
 
         total_price = _parse_money_token(tokens[-1])
         unit_price = _parse_money_token(tokens[-2])
@@ -285,6 +380,9 @@ def extract_line_items(text: str) -> list[ExtractedLineItem]:
     return deduped
 
 
+_DECIMAL_COMMA_RE = re.compile(r"\d+,\d{1,2}")
+
+
 def _parse_money_token(token: str) -> float | None:
     token = token.strip()
     token = token.replace(" ", "")
@@ -294,7 +392,7 @@ def _parse_money_token(token: str) -> float | None:
 
     token = token.replace(".", "")
 
-    if token.count(",") == 1 and re.fullmatch(r"\d+,\d{1,2}", token):
+    if token.count(",") == 1 and _DECIMAL_COMMA_RE.fullmatch(token):
         token = token.replace(",", ".")
     else:
         token = token.replace(",", "")
@@ -309,25 +407,23 @@ def _parse_money_token(token: str) -> float | None:
     return value
 
 
-def extract_total_amount(text: str) -> float | None:
-    normalized = clean_ocr_text(text)
-    lines = [ln.strip() for ln in normalized.split("\n") if ln.strip()]
+_TOTAL_WORD_RE = re.compile(r"\b(total|tổng|thành\s*toán|amount)\b", re.I)
+_SUBTOTAL_RE = re.compile(r"\b(sub\s*total|subtotal)\b", re.I)
+_TAX_RE = re.compile(r"\b(tax|vat)\b", re.I)
 
-    total_word_re = re.compile(r"\b(total|tổng|thành\s*toán|amount)\b", re.I)
-    subtotal_re = re.compile(r"\b(sub\s*total|subtotal)\b", re.I)
-    tax_re = re.compile(r"\b(tax|vat)\b", re.I)
+
+def extract_total_amount(text: str | ParsedDocument) -> float | None:
+    lines = _as_document(text).lines
 
     # Pass 1: prefer explicit TOTAL lines, exclude SUBTOTAL/TAX.
     best: float | None = None
     for ln in lines:
-        if not total_word_re.search(ln):
+        if not _TOTAL_WORD_RE.search(ln.text):
             continue
-        if subtotal_re.search(ln) or tax_re.search(ln):
+        if _SUBTOTAL_RE.search(ln.text) or _TAX_RE.search(ln.text):
             continue
-        tokens = re.findall(r"\d[\d., ]{2,}", ln)
-        parsed = [v for v in (_parse_money_token(t) for t in tokens) if v is not None]
-        if parsed:
-            cand = max(parsed)
+        if ln.amounts:
+            cand = max(ln.amounts)
             best = cand if best is None else max(best, cand)
 
     if best is not None:
@@ -335,24 +431,19 @@ def extract_total_amount(text: str) -> float | None:
 
     # Pass 2: fallback to keyword-based scan (including subtotal etc.)
     for ln in lines:
-        ln_lower = ln.lower()
-        if any(k in ln_lower for k in _TOTAL_KEYWORDS):
-            tokens = re.findall(r"\d[\d., ]{2,}", ln)
-            parsed = [v for v in (_parse_money_token(t) for t in tokens) if v is not None]
-            if parsed:
-                return max(parsed)
-
-    tokens = re.findall(r"\d[\d., ]{2,}", normalized)
-    parsed = [v for v in (_parse_money_token(t) for t in tokens) if v is not None]
+        if ln.amounts and any(k in ln.lower for k in _TOTAL_KEYWORDS):
+            return max(ln.amounts)
+
+    parsed = [v for ln in lines for v in ln.amounts]
     if not parsed:
         return None
     return max(parsed)
 
 
-def extract_fields(text: str) -> ExtractedFields:
-    text = clean_ocr_text(text)
+def extract_fields(text: str | ParsedDocument) -> ExtractedFields:
+    doc = _as_document(text)
     return ExtractedFields(
-        store_name=extract_store_name(text),
-        date=extract_date(text),
-        total_amount=extract_total_amount(text),
+        store_name=extract_store_name(doc),
+        date=extract_date(doc),
+        total_amount=extract_total_amount(doc),
     )
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+
+
+# Enough to reach the JPEG SOF marker behind typical EXIF blocks (incl. thumbnails).
+PROBE_BYTES = 256 * 1024
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str
+    ext: str
+    width: int | None = None
+    height: int | None = None
+
+
+_EXTS = {
+    "png": ".png",
+    "jpeg": ".jpg",
+    "webp": ".webp",
+    "bmp": ".bmp",
+    "tiff": ".tif",
+}
+
+# Every extension an accepted upload is stored under
+IMAGE_EXTS = tuple(_EXTS.values())
+
+
+def sniff_format(head: bytes) -> str | None:
+    """Identify the image type from its magic bytes (the filename is not trusted)."""
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def _png_size(head: bytes) -> tuple[int, int] | None:
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def _jpeg_size(head: bytes) -> tuple[int, int] | None:
+    i = 2
+    n = len(head)
+    while i + 4 <= n:
+        if head[i] != 0xFF:
+            i += 1
+            continue
+        marker = head[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        seg_len = struct.unpack(">H", head[i + 2 : i + 4])[0]
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack(">HH", head[i + 5 : i + 9])
+            return width, height
+        i += 2 + seg_len
+    return None
+
+
+def _webp_size(head: bytes) -> tuple[int, int] | None:
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        b = head[21:25]
+        width = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        height = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return width, height
+    if chunk == b"VP8X":
+        width = 1 + int.from_bytes(head[24:27], "little")
+        height = 1 + int.from_bytes(head[27:30], "little")
+        return width, height
+    return None
+
+
+def _bmp_size(head: bytes) -> tuple[int, int] | None:
+    if len(head) < 26:
+        return None
+    width, height = struct.unpack("<ii", head[18:26])
+    return abs(width), abs(height)
+
+
+def _tiff_size(head: bytes) -> tuple[int, int] | None:
+    if len(head) < 8:
+        return None
+    endian = "<" if head[:2] == b"II" else ">"
+    offset = struct.unpack(endian + "I", head[4:8])[0]
+    if offset + 2 > len(head):
+        # First IFD is beyond what we buffered (e.g. written at the end of the file).
+        return None
+    count = struct.unpack(endian + "H", head[offset : offset + 2])[0]
+    width = height = None
+    for k in range(count):
+        entry = offset + 2 + k * 12
+        if entry + 12 > len(head):
+            break
+        tag, typ = struct.unpack(endian + "HH", head[entry : entry + 4])
+        if typ == 3:
+            value = struct.unpack(endian + "H", head[entry + 8 : entry + 10])[0]
+        else:
+            value = struct.unpack(endian + "I", head[entry + 8 : entry + 12])[0]
+        if tag == 256:
+            width = value
+        elif tag == 257:
+            height = value
+    if width is None or height is None:
+        return None
+    return width, height
+
+
+_SIZE_PROBES = {
+    "png": _png_size,
+    "jpeg": _jpeg_size,
+    "webp": _webp_size,
+    "bmp": _bmp_size,
+    "tiff": _tiff_size,
+}
+
+
+def inspect_image(head: bytes, max_pixels: int | None = None) -> ImageInfo:
+    """Sniff type and read dimensions from the header only (no decode).
+
+    Raises UnsupportedImage for non-image data and ImageTooLarge when the
+    declared resolution exceeds `max_pixels`. Dimensions that cannot be found
+    in `head` are left as None.
+    """
+
+    fmt = sniff_format(head)
+    if fmt is None:
+        raise UnsupportedImage("Unsupported file type")
+
+    try:
+        size = _SIZE_PROBES[fmt](head)
+    except struct.error:
+        size = None
+
+    width, height = size if size else (None, None)
+    if max_pixels and width and height and width * height > max_pixels:
+        raise ImageTooLarge(
+            f"Image resolution too large ({width}x{height}, max {max_pixels} pixels)"
+        )
+    return ImageInfo(format=fmt, ext=_EXTS[fmt], width=width, height=height)
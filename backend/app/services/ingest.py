@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import hashlib
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator
+
+from sqlalchemy.orm import Session
+
+from ..models import Receipt, ReceiptItem
+from .category import categorize
+from ..config import get_settings
+from .excel import ExcelCompactor, append_receipts_to_excel
+from .extract import parse_receipt_date
+from .image_probe import PROBE_BYTES, inspect_image
+from .metrics import STAGE_DURATION
+from .ocr_pool import OcrResult
+from .rollups import category_group, receipts_added
+from .storage import (
+    add_image_refs,
+    content_key,
+    get_image_store,
+    image_path_for,
+    temp_upload_path,
+    track_image,
+)
+from .text import item_key
+from .versions import receipts_changed
+
+
+EXCEL_EXPORT_PATH = "exports/receipts.xlsx"
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    image_path: str
+    sha256: str
+
+
+def content_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def save_upload(fileobj: BinaryIO, max_bytes: int, max_pixels: int) -> StoredImage:
+    """Stream an upload to a temp file in chunks, hashing it in the same pass,
+    then hand it to the image store under its content hash.
+
+    The type is sniffed from the magic bytes and the resolution read from the
+    header before anything is written, so non-images and absurd resolutions are
+    rejected without a full decode. Raises UploadTooLarge, UnsupportedImage or
+    ImageTooLarge; a partially written file is removed.
+    """
+
+    head = bytearray()
+    while len(head) < PROBE_BYTES:
+        chunk = fileobj.read(PROBE_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+
+    if len(head) > max_bytes:
+        raise UploadTooLarge(f"File too large (max {max_bytes} bytes)")
+    info = inspect_image(bytes(head), max_pixels)
+
+    hasher = hashlib.sha256(head)
+    size = len(head)
+    tmp_path = temp_upload_path()
+    try:
+        with STAGE_DURATION.time("save"):
+            with open(tmp_path, "wb") as out:
+                out.write(head)
+                while True:
+                    chunk = fileobj.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLarge(f"File too large (max {max_bytes} bytes)")
+                    hasher.update(chunk)
+                    out.write(chunk)
+            # Closed first: the store may upload the file rather than rename it.
+            key = content_key(hasher.hexdigest(), info.ext)
+            track_image(key)
+            get_image_store().put_file(key, tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return StoredImage(image_path=image_path_for(key), sha256=hasher.hexdigest())
+
+
+def store_image(content: bytes, sha256: str, ext: str) -> str:
+    """Store an in-memory image under its content hash; returns its image_path."""
+
+    key = content_key(sha256, ext)
+    with STAGE_DURATION.time("save"):
+        track_image(key)
+        get_image_store().put_bytes(key, content)
+    return image_path_for(key)
+
+
+def _zip_members(zf: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [i for i in zf.infolist() if not i.is_dir() and not i.filename.startswith("__MACOSX/")]
+
+
+def count_batch_entries(fileobj: BinaryIO) -> int:
+    """Number of entries `iter_batch_entries` will yield, read from the ZIP directory only."""
+
+    try:
+        if not zipfile.is_zipfile(fileobj):
+            return 1
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as zf:
+            return len(_zip_members(zf))
+    except zipfile.BadZipFile:
+        return 1
+    finally:
+        fileobj.seek(0)
+
+
+def iter_batch_entries(
+    filename: str, fileobj: BinaryIO, max_bytes: int
+) -> Iterator[tuple[str, bytes | None, str | None]]:
+    """Yield (name, bytes, error) for an uploaded image, or for every file inside a ZIP.
+
+    Entries larger than `max_bytes` are yielded with an error instead of being read.
+    """
+
+    too_large = f"File too large (max {max_bytes} bytes)"
+
+    if not zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        content = fileobj.read(max_bytes + 1)
+        if len(content) > max_bytes:
+            yield filename, None, too_large
+        else:
+            yield filename, content, None
+        return
+
+    fileobj.seek(0)
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in _zip_members(zf):
+            if info.file_size > max_bytes:
+                yield info.filename, None, too_large
+                continue
+            # Bounded read: don't trust the declared size of a hostile archive.
+            with zf.open(info) as fh:
+                content = fh.read(max_bytes + 1)
+            if len(content) > max_bytes:
+                yield info.filename, None, too_large
+            else:
+                yield info.filename, content, None
+
+
+def build_receipt(image_path: str, result: OcrResult) -> Receipt:
+    """Build an unsaved Receipt (with its line items) from an OCR result."""
+
+    category = categorize(result.fields.store_name)
+    return Receipt(
+        store_name=result.fields.store_name,
+        date=result.fields.date,
+        purchased_at=parse_receipt_date(result.fields.date),
+        total_amount=result.fields.total_amount,
+        category=category,
+        category_group=category_group(category),
+        image_path=image_path,
+        raw_text=result.raw_text,
+        items=[
+            ReceiptItem(
+                item_name=it.item_name,
+                item_key=item_key(it.item_name),
+                quantity=it.quantity,
+                unit_price=it.unit_price,
+                total_price=it.total_price,
+            )
+            for it in result.items
+        ],
+    )
+
+
+def save_receipts(db: Session, entries: list[tuple[str, OcrResult]]) -> list[Receipt]:
+    """Insert receipts and their items for one chunk in a single transaction."""
+
+    receipts = [build_receipt(image_path, result) for image_path, result in entries]
+    db.add_all(receipts)
+    db.flush()
+    add_image_refs(db, [r.image_path for r in receipts])
+    receipts_added(db, receipts)
+    receipts_changed(db)
+    with STAGE_DURATION.time("db_commit"):
+        db.commit()
+    return receipts
+
+
+def append_to_excel(receipts: Receipt | list[Receipt]) -> None:
+    if isinstance(receipts, Receipt):
+        receipts = [receipts]
+
+    # Best-effort append to the Excel journal (local storage)
+    try:
+        with STAGE_DURATION.time("excel"):
+            append_receipts_to_excel(receipts, EXCEL_EXPORT_PATH)
+    except Exception:
+        pass
+
+
+def create_excel_compactor() -> ExcelCompactor | None:
+    interval = get_settings().excel_compact_interval
+    if interval <= 0:
+        return None
+    return ExcelCompactor(EXCEL_EXPORT_PATH, interval)
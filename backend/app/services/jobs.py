@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..db import SessionLocal
+from ..models import IngestJob
+from . import ocr_cache
+from .ingest import append_to_excel, build_receipt
+from .metrics import STAGE_DURATION, observe_ocr_timings
+from .ocr_pool import OcrQueueFull, get_ocr_pool, process_image
+from .rollups import receipts_added
+from .storage import add_image_refs, get_image_store, key_of, release_image
+from .thumbnails import create_derivatives
+from .versions import receipts_changed
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def enqueue_job(
+    db: Session, image_path: str, image_sha256: str | None = None, pipeline: str | None = None
+) -> IngestJob:
+    job = IngestJob(status=JOB_QUEUED, image_path=image_path, image_sha256=image_sha256, pipeline=pipeline)
+    db.add(job)
+    add_image_refs(db, [image_path])
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def count_queued_jobs(db: Session) -> int:
+    return db.execute(
+        select(func.count()).select_from(IngestJob).where(IngestJob.status == JOB_QUEUED)
+    ).scalar_one()
+
+
+def _claimable(now: datetime):
+    # Queued jobs, plus running jobs whose worker stopped renewing the lease (crash).
+    return or_(
+        IngestJob.status == JOB_QUEUED,
+        and_(IngestJob.status == JOB_RUNNING, IngestJob.locked_until < now),
+    )
+
+
+def _supports_skip_locked(db: Session) -> bool:
+    return db.get_bind().dialect.name in {"mysql", "mariadb", "postgresql"}
+
+
+def claim_job(db: Session, worker_id: str, lease_seconds: int) -> IngestJob | None:
+    """Atomically move one claimable job to `running` for this worker.
+
+    MySQL uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never block
+    on (or double-claim) the same row. SQLite has no row locks but serializes
+    writers, so a compare-and-set UPDATE on the previous state gives the same
+    guarantee there.
+    """
+
+    now = datetime.utcnow()
+    stmt = select(IngestJob).where(_claimable(now)).order_by(IngestJob.id.asc()).limit(1)
+
+    if _supports_skip_locked(db):
+        job = db.execute(stmt.with_for_update(skip_locked=True)).scalars().first()
+        if job is None:
+            db.rollback()
+            return None
+        job.status = JOB_RUNNING
+        job.attempts += 1
+        job.worker_id = worker_id
+        job.locked_until = now + timedelta(seconds=lease_seconds)
+        db.commit()
+        return job
+
+    for _ in range(5):
+        candidate = db.execute(stmt).scalars().first()
+        if candidate is None:
+            db.rollback()
+            return None
+        res = db.execute(
+            update(IngestJob)
+            .where(
+                IngestJob.id == candidate.id,
+                IngestJob.status == candidate.status,
+                IngestJob.attempts == candidate.attempts,
+            )
+            .values(
+                status=JOB_RUNNING,
+                attempts=IngestJob.attempts + 1,
+                worker_id=worker_id,
+                locked_until=now + timedelta(seconds=lease_seconds),
+                updated_at=now,
+            )
+        )
+        db.commit()
+        if res.rowcount == 1:
+            db.refresh(candidate)
+            return candidate
+        # Another worker won the race; try the next candidate.
+    return None
+
+
+@dataclass(frozen=True)
+class JobClaim:
+    """What a worker claimed, read once: the job row itself may be taken over later."""
+
+    job_id: int
+    worker_id: str
+    attempts: int
+    image_path: str
+
+    @classmethod
+    def of(cls, job: IngestJob) -> JobClaim:
+        return cls(job.id, job.worker_id, job.attempts, job.image_path)
+
+    def owned(self):
+        # Still this claim's job: a worker that lost its lease must not touch it.
+        return and_(
+            IngestJob.id == self.job_id,
+            IngestJob.worker_id == self.worker_id,
+            IngestJob.attempts == self.attempts,
+            IngestJob.status == JOB_RUNNING,
+        )
+
+
+def renew_leases(db: Session, worker_id: str, job_ids: list[int], lease_seconds: int) -> int:
+    """Extend the lease of this worker's running jobs; returns how many it still holds."""
+
+    if not job_ids:
+        return 0
+    res = db.execute(
+        update(IngestJob)
+        .where(IngestJob.id.in_(job_ids), IngestJob.worker_id == worker_id, IngestJob.status == JOB_RUNNING)
+        .values(locked_until=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    db.commit()
+    return res.rowcount
+
+
+def fail_job(db: Session, claim: JobClaim, error: str, max_attempts: int) -> None:
+    """Re-queue the claimed job (or fail it for good after `max_attempts`).
+
+    Nothing happens when the lease was lost and another worker claimed the job.
+    """
+
+    status = JOB_QUEUED if claim.attempts < max_attempts else JOB_FAILED
+    res = db.execute(
+        update(IngestJob)
+        .where(claim.owned())
+        .values(status=status, error=error[:4000], worker_id=None, locked_until=None)
+    )
+    if res.rowcount == 1 and status == JOB_FAILED:
+        release_image(db, claim.image_path)
+    db.commit()
+
+
+def requeue_job(db: Session, claim: JobClaim) -> None:
+    # Handed back unprocessed (worker stopping), so the claim doesn't count as an attempt.
+    db.execute(
+        update(IngestJob)
+        .where(claim.owned())
+        .values(status=JOB_QUEUED, attempts=IngestJob.attempts - 1, worker_id=None, locked_until=None)
+    )
+    db.commit()
+
+
+class JobInterrupted(RuntimeError):
+    pass
+
+
+def _run_ocr(
+    image_path: str,
+    image_sha256: str | None,
+    pipeline: str | None,
+    max_wait: float,
+    stop: threading.Event,
+):
+    cached = ocr_cache.lookup(image_sha256, pipeline=pipeline)
+    if cached is not None:
+        return cached
+
+    # A local path, or the image bytes when the store is remote
+    source = get_image_store().load(key_of(image_path))
+    pool = get_ocr_pool()
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            future = pool.submit(process_image, source, pipeline=pipeline)
+            break
+        except OcrQueueFull:
+            # The pool is shared with other callers; back off instead of failing the job,
+            # but not past one lease or a shutdown.
+            if stop.is_set():
+                raise JobInterrupted("Worker stopping before OCR started")
+            if time.monotonic() >= deadline:
+                raise
+            stop.wait(0.5)
+    result = future.result()
+
+    observe_ocr_timings(result.timings)
+    ocr_cache.store(image_sha256, result, pipeline=pipeline)
+    return result
+
+
+def process_job(db: Session, job: IngestJob, stop: threading.Event | None = None) -> None:
+    settings = get_settings()
+    stop = stop or threading.Event()
+    claim = JobClaim.of(job)
+    image_path = claim.image_path
+
+    if claim.attempts > settings.job_max_attempts:
+        res = db.execute(
+            update(IngestJob)
+            .where(claim.owned())
+            .values(
+                status=JOB_FAILED,
+                error=job.error or "Too many attempts (worker crashed while processing)",
+                locked_until=None,
+            )
+        )
+        if res.rowcount == 1:
+            release_image(db, image_path)
+        db.commit()
+        return
+
+    try:
+        result = _run_ocr(image_path, job.image_sha256, job.pipeline, settings.job_lease_seconds, stop)
+    except JobInterrupted:
+        db.rollback()
+        requeue_job(db, claim)
+        return
+    except Exception as e:
+        db.rollback()
+        fail_job(db, claim, f"OCR failed: {e}", settings.job_max_attempts)
+        return
+
+    try:
+        receipt = build_receipt(image_path, result)
+        db.add(receipt)
+        db.flush()
+
+        # Receipt and job completion land in one transaction, so a crash can't
+        # leave a saved receipt behind a job that will be retried. The job is
+        # only completed if this worker still holds it; otherwise another worker
+        # took it over after the lease expired and will save its own receipt.
+        res = db.execute(
+            update(IngestJob)
+            .where(claim.owned())
+            .values(status=JOB_DONE, receipt_id=receipt.id, error=None, locked_until=None)
+        )
+        if res.rowcount != 1:
+            db.rollback()
+            return
+        receipts_added(db, [receipt])
+        receipts_changed(db)
+        with STAGE_DURATION.time("db_commit"):
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        fail_job(db, claim, f"Saving receipt failed: {e}", settings.job_max_attempts)
+        return
+
+    append_to_excel(receipt)
+    create_derivatives(image_path)
+
+
+class JobWorker:
+    """Polls the job table from a few threads until stopped.
+
+    A heartbeat thread renews the lease of every job in flight, so a slow OCR
+    is not taken over by another worker. `stop()` lets every thread finish the
+    job it already claimed before returning (jobs still waiting for an OCR slot
+    are handed back to the queue), so a graceful shutdown never abandons work.
+    """
+
+    def __init__(self, threads: int, poll_interval: float, lease_seconds: int):
+        self.threads = max(threads, 1)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._active: set[int] = set()
+        self._active_lock = threading.Lock()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def start(self) -> None:
+        for i in range(self.threads):
+            t = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="ingest-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+        # Kept beating until the in-flight jobs are done.
+        self._heartbeat_stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout)
+            self._heartbeat = None
+
+    def _renew_loop(self) -> None:
+        # A third of the lease, so one missed beat (DB hiccup) doesn't lose the job.
+        interval = max(self.lease_seconds / 3, 1.0)
+        while not self._heartbeat_stop.wait(interval):
+            with self._active_lock:
+                job_ids = list(self._active)
+            try:
+                with SessionLocal() as db:
+                    renew_leases(db, self.worker_id, job_ids, self.lease_seconds)
+            except Exception:
+                pass
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with SessionLocal() as db:
+                    job = claim_job(db, self.worker_id, self.lease_seconds)
+                    if job is not None:
+                        job_id = job.id
+                        with self._active_lock:
+                            self._active.add(job_id)
+                        try:
+                            process_job(db, job, self._stop)
+                        finally:
+                            with self._active_lock:
+                                self._active.discard(job_id)
+                        continue
+            except Exception:
+                # DB hiccup; back off and retry.
+                pass
+            self._stop.wait(self.poll_interval)
+
+
+def create_worker() -> JobWorker:
+    settings = get_settings()
+    return JobWorker(
+        threads=settings.job_worker_threads,
+        poll_interval=settings.job_poll_interval,
+        lease_seconds=settings.job_lease_seconds,
+    )
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import Row, select, tuple_
+from sqlalchemy.orm import Session
+
+from ..models import Receipt
+from .export import ExportFilter
+
+
+# Everything ReceiptOut needs; raw_text (the large column) is never read.
+LIST_COLUMNS = (
+    Receipt.id,
+    Receipt.store_name,
+    Receipt.date,
+    Receipt.purchased_at,
+    Receipt.total_amount,
+    Receipt.category,
+    Receipt.image_path,
+    Receipt.created_at,
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, receipt_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{receipt_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, receipt_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(receipt_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def list_receipts_page(
+    db: Session, filters: ExportFilter, limit: int, cursor: str | None = None
+) -> tuple[list[Row], str | None]:
+    """One page of receipts, newest first, and the cursor of the next page (None on the last).
+
+    Keyset-paginated on (created_at, id), which the `ix_receipts_created_at_id`
+    index serves directly, so a deep page costs the same as the first one.
+    """
+
+    query = select(*LIST_COLUMNS)
+    query = filters.apply(query)
+    if cursor:
+        created_at, receipt_id = decode_cursor(cursor)
+        query = query.where(tuple_(Receipt.created_at, Receipt.id) < tuple_(created_at, receipt_id))
+    query = query.order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a cached DB read up to a slow multi-region OCR
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Ingestion stages recorded in ocr_stage_duration_seconds
+STAGES = ("save", "preprocess", "tesseract", "extract", "db_commit", "excel", "derivatives")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]: ...
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, seconds: float, *labels) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += seconds
+
+    @contextmanager
+    def time(self, *labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class GaugeFunc(_Metric):
+    """Gauge read from live state when scraped.
+
+    `read` returns a number, or a {label values: number} dict when the gauge has labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, read: Callable[[], float | dict[tuple, float]], labelnames: tuple[str, ...] = ()
+    ):
+        super().__init__(name, help, labelnames)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, v in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(v)}"
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status")
+)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+)
+STAGE_DURATION = Histogram(
+    "ocr_stage_duration_seconds",
+    "Ingestion stage latency (" + ", ".join(STAGES) + ")",
+    ("stage",),
+)
+
+
+def observe_ocr_timings(timings: dict[str, float]) -> None:
+    """Record an OcrResult's timings (ms, measured in the pool worker) as stage latencies.
+
+    Every preprocessing step (decode included) counts towards `preprocess`.
+    Cache hits carry no timings and record nothing.
+    """
+
+    if not timings:
+        return
+    preprocess = 0.0
+    for name, ms in timings.items():
+        if name in ("tesseract", "extract"):
+            STAGE_DURATION.observe(ms / 1000.0, name)
+        else:
+            preprocess += ms
+    STAGE_DURATION.observe(preprocess / 1000.0, "preprocess")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Expose /metrics on its own port from a daemon thread (for processes without the API)."""
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
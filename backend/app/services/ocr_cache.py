@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from ..config import get_settings
+from ..db import SessionLocal
+from ..models import OcrCacheEntry
+from .ocr import PREPROCESS_VERSION, preprocess_signature
+from .ocr_engine import OCR_CONFIG, engine_kind
+from .ocr_pool import OcrResult, result_from_text
+from .versions import bump_version, get_version
+
+
+# Bumped by `invalidate`; every process drops its in-memory entries when it changes.
+GENERATION_KEY = "ocr_cache"
+
+
+def cache_key(image_sha256: str, lang: str | None = None, pipeline: str | None = None) -> str:
+    settings = get_settings()
+    parts = [
+        image_sha256,
+        (lang or "").strip() or settings.ocr_lang,
+        settings.ocr_fallback_lang or "",
+        engine_kind(),
+        OCR_CONFIG,
+        preprocess_signature(pipeline),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class OcrCache:
+    """Bounded in-process LRU of OCR text, backed by the shared `ocr_cache` table.
+
+    The LRU belongs to one generation of the cache (a counter in `data_versions`),
+    so `invalidate` in any process empties it everywhere. The generation is
+    checked at most every `reload_interval` seconds, which keeps LRU hits off
+    the database.
+    """
+
+    def __init__(self, max_entries: int, persist: bool, reload_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.reload_interval = reload_interval
+        self.hits = 0
+        self.misses = 0
+        self._lru: OrderedDict[str, str] = OrderedDict()
+        self._generation: int | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _sync_generation(self) -> None:
+        if self.max_entries <= 0 or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        try:
+            with SessionLocal() as db:
+                generation = get_version(db, GENERATION_KEY)
+        except Exception:
+            # DB unreachable: keep the entries, check again next interval.
+            generation = self._generation
+        with self._lock:
+            if generation != self._generation:
+                self._lru.clear()
+                self._generation = generation
+            self._checked_at = time.monotonic()
+
+    def get(self, key: str) -> str | None:
+        self._sync_generation()
+        with self._lock:
+            text = self._lru.get(key)
+            if text is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return text
+
+        if self.persist:
+            with SessionLocal() as db:
+                text = db.execute(
+                    select(OcrCacheEntry.raw_text).where(OcrCacheEntry.key == key)
+                ).scalar_one_or_none()
+            if text is not None:
+                with self._lock:
+                    self.hits += 1
+                self._remember(key, text)
+                return text
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, image_sha256: str, raw_text: str) -> None:
+        self._remember(key, raw_text)
+        if not self.persist:
+            return
+
+        with SessionLocal() as db:
+            db.add(
+                OcrCacheEntry(
+                    key=key,
+                    image_sha256=image_sha256,
+                    preprocess_version=PREPROCESS_VERSION,
+                    raw_text=raw_text,
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker cached the same image first.
+                db.rollback()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries_in_memory": len(self._lru),
+                "max_entries": self.max_entries,
+                "preprocess_version": PREPROCESS_VERSION,
+            }
+
+    def _remember(self, key: str, text: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._lru[key] = text
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+
+_cache: OcrCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OcrCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = get_settings()
+                _cache = OcrCache(
+                    settings.ocr_cache_size, settings.ocr_cache_persist, settings.ocr_cache_reload_interval
+                )
+    return _cache
+
+
+def lookup(image_sha256: str | None, lang: str | None = None, pipeline: str | None = None) -> OcrResult | None:
+    """Return the extraction result for a previously OCR'd image, skipping OCR."""
+
+    if not image_sha256:
+        return None
+    try:
+        text = get_ocr_cache().get(cache_key(image_sha256, lang, pipeline))
+    except Exception:
+        return None
+    if text is None:
+        return None
+    return result_from_text(text)
+
+
+def store(
+    image_sha256: str | None, result: OcrResult, lang: str | None = None, pipeline: str | None = None
+) -> None:
+    if not image_sha256:
+        return
+    try:
+        get_ocr_cache().put(cache_key(image_sha256, lang, pipeline), image_sha256, result.raw_text)
+    except Exception:
+        # The cache is an optimization; never fail ingestion because of it.
+        pass
+
+
+def invalidate(all_entries: bool = False) -> int:
+    """Drop cached OCR text from older preprocessing versions (or everything).
+
+    Returns the number of persisted rows removed.
+    """
+
+    stmt = delete(OcrCacheEntry)
+    if not all_entries:
+        stmt = stmt.where(OcrCacheEntry.preprocess_version != PREPROCESS_VERSION)
+    with SessionLocal() as db:
+        res = db.execute(stmt)
+        # Other API and ingest processes drop their in-memory entries on their next lookup.
+        bump_version(db, GENERATION_KEY)
+        db.commit()
+    get_ocr_cache().clear()
+    return res.rowcount or 0
+
+
+def persisted_count() -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(OcrCacheEntry)).scalar_one()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from ..config import get_settings
+
+
+OCR_OEM = 3
+OCR_PSM = 6
+OCR_CONFIG = f"--oem {OCR_OEM} --psm {OCR_PSM}"
+
+
+def _guess_tessdata_dir(settings) -> Path | None:
+    # Highest priority: explicit env/config
+    if settings.tessdata_prefix:
+        p = Path(settings.tessdata_prefix)
+        return p if p.exists() else None
+
+    # Next: based on TESSERACT_CMD
+    if settings.tesseract_cmd:
+        p = Path(settings.tesseract_cmd).parent / "tessdata"
+        if p.exists():
+            return p
+
+    # Common Windows install locations
+    if os.name == "nt":
+        candidates = [
+            Path(r"C:\Program Files\Tesseract-OCR\tessdata"),
+            Path(r"C:\Program Files (x86)\Tesseract-OCR\tessdata"),
+        ]
+        for c in candidates:
+            if c.exists():
+                return c
+
+    return None
+
+
+def _list_installed_langs(tessdata_dir: Path) -> set[str]:
+    try:
+        return {p.stem for p in tessdata_dir.glob("*.traineddata") if p.is_file()}
+    except Exception:
+        return set()
+
+
+class OcrEngine(ABC):
+    """Text recognizer for a preprocessed (grayscale/binary) image.
+
+    Engines are created once per worker process; language and tessdata
+    discovery happen in the constructor, not on every call.
+    """
+
+    name = "base"
+
+    def __init__(self, lang: str, fallback_lang: str | None, tessdata_dir: Path | None, psm: int, oem: int):
+        self.lang = lang
+        self.fallback_lang = fallback_lang
+        self.tessdata_dir = tessdata_dir
+        self.psm = psm
+        self.oem = oem
+
+    @abstractmethod
+    def recognize(self, image: np.ndarray) -> str: ...
+
+    def close(self) -> None:
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Fallback engine: one `tesseract` subprocess per call (pytesseract's binary/errors).
+
+    The image is piped in-memory over stdin instead of pytesseract's temp-file
+    round-trip.
+    """
+
+    name = "pytesseract"
+
+    def __init__(self, *args, installed: set[str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.installed = installed
+
+    def _run(self, image: np.ndarray, lang: str) -> str:
+        import cv2
+        import pytesseract
+
+        ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise ValueError("Cannot encode image for tesseract")
+
+        cmd = [
+            pytesseract.pytesseract.tesseract_cmd,
+            "stdin",
+            "stdout",
+            "-l",
+            lang,
+            "--oem",
+            str(self.oem),
+            "--psm",
+            str(self.psm),
+        ]
+        try:
+            proc = subprocess.run(cmd, input=encoded.tobytes(), capture_output=True)
+        except FileNotFoundError:
+            raise pytesseract.TesseractNotFoundError()
+        if proc.returncode != 0:
+            message = proc.stderr.decode("utf-8", errors="replace").strip()
+            raise pytesseract.TesseractError(proc.returncode, message)
+        return proc.stdout.decode("utf-8", errors="replace").strip()
+
+    def recognize(self, image: np.ndarray) -> str:
+        try:
+            return self._run(image, self.lang)
+        except Exception as e:
+            # If language pack is missing, optionally fall back to a secondary language.
+            if self.fallback_lang and self.fallback_lang != self.lang:
+                try:
+                    return self._run(image, self.fallback_lang)
+                except Exception:
+                    pass
+
+            if self.installed:
+                raise RuntimeError(
+                    f"Tesseract OCR failed for lang='{self.lang}'. Installed languages: {sorted(self.installed)}. Details: {e}"
+                )
+            raise
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps a loaded Tesseract API handle (tesserocr) and feeds it raw pixels.
+
+    No subprocess, no temp file, no traineddata reload per call. The handle is
+    not thread-safe, so calls on one engine are serialized.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import tesserocr
+
+        kwargs = {"psm": tesserocr.PSM(self.psm), "oem": tesserocr.OEM(self.oem)}
+        if self.tessdata_dir is not None:
+            kwargs["path"] = str(self.tessdata_dir)
+
+        self._lock = threading.Lock()
+        try:
+            self._api = tesserocr.PyTessBaseAPI(lang=self.lang, **kwargs)
+        except RuntimeError:
+            if not self.fallback_lang or self.fallback_lang == self.lang:
+                raise
+            self.lang = self.fallback_lang
+            self._api = tesserocr.PyTessBaseAPI(lang=self.lang, **kwargs)
+
+    def recognize(self, image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        if image.ndim == 2:
+            height, width = image.shape
+            bpp = 1
+        else:
+            height, width, bpp = image.shape
+
+        with self._lock:
+            self._api.SetImageBytes(image.tobytes(), width, height, bpp, width * bpp)
+            text = self._api.GetUTF8Text()
+            self._api.Clear()
+        return text.strip()
+
+    def close(self) -> None:
+        self._api.End()
+
+
+@lru_cache
+def engine_kind() -> str:
+    """Engine the OCR_ENGINE setting resolves to here: "tesserocr" or "pytesseract"."""
+
+    kind = (get_settings().ocr_engine or "auto").strip().lower()
+    if kind == "auto":
+        return "tesserocr" if importlib.util.find_spec("tesserocr") is not None else "pytesseract"
+    return kind
+
+
+def create_engine(lang: str | None = None, kind: str | None = None) -> OcrEngine:
+    """Resolve tesseract paths and languages once and build an engine.
+
+    `kind` is "auto" (tesserocr when importable, else pytesseract), "tesserocr"
+    or "pytesseract"; defaults to the OCR_ENGINE setting.
+    """
+
+    settings = get_settings()
+    kind = (kind or settings.ocr_engine or "auto").strip().lower()
+
+    if settings.tesseract_cmd:
+        import pytesseract
+
+        pytesseract.pytesseract.tesseract_cmd = settings.tesseract_cmd
+
+    # If user doesn't provide TESSDATA_PREFIX, try to infer it.
+    tessdata_dir = _guess_tessdata_dir(settings)
+    if tessdata_dir is not None:
+        os.environ["TESSDATA_PREFIX"] = str(tessdata_dir)
+
+    primary_lang = (lang or "").strip() or settings.ocr_lang
+
+    # If we can see installed languages and primary is missing, try fallback early.
+    installed = _list_installed_langs(tessdata_dir) if tessdata_dir is not None else set()
+    fallback_lang = (settings.ocr_fallback_lang or "").strip() or None
+    if installed and primary_lang not in installed and fallback_lang and fallback_lang in installed:
+        primary_lang = fallback_lang
+
+    args = (primary_lang, fallback_lang, tessdata_dir, OCR_PSM, OCR_OEM)
+
+    if kind in {"auto", "tesserocr"}:
+        try:
+            return TesserocrEngine(*args)
+        except Exception:
+            if kind == "tesserocr":
+                raise
+
+    return PytesseractEngine(*args, installed=installed)
+
+
+_engines: dict[str | None, OcrEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(lang: str | None = None) -> OcrEngine:
+    """Per-process engine for `lang` (default language when None), created on first use."""
+
+    key = (lang or "").strip() or None
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_engine(key)
+                _engines[key] = engine
+    return engine
+
+
+_thread_engines = threading.local()
+
+
+def get_thread_engine(lang: str | None = None) -> OcrEngine:
+    """Engine owned by the calling thread, for concurrent region OCR.
+
+    A tesserocr handle can't be shared across threads without serializing them,
+    so each region thread keeps its own.
+    """
+
+    key = (lang or "").strip() or None
+    engines = getattr(_thread_engines, "engines", None)
+    if engines is None:
+        engines = _thread_engines.engines = {}
+    engine = engines.get(key)
+    if engine is None:
+        engine = engines[key] = create_engine(key)
+    return engine
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from ..config import get_settings
+from .extract import (
+    ExtractedFields,
+    ExtractedLineItem,
+    extract_fields,
+    extract_line_items,
+    parse_document,
+)
+from .metrics import GaugeFunc
+from .regions import ocr_process_count
+
+
+class OcrQueueFull(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class OcrResult:
+    raw_text: str
+    fields: ExtractedFields
+    items: list[ExtractedLineItem] = field(default_factory=list)
+
+    # Wall time (ms) per pipeline stage, tesseract and extraction; empty on cache hits
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def _init_worker(threads: int) -> None:
+    # Tesseract reads OMP_THREAD_LIMIT on startup; cap it so N workers don't fight over cores.
+    os.environ["OMP_THREAD_LIMIT"] = str(threads)
+
+    import cv2
+
+    cv2.setNumThreads(threads)
+
+    # Load tesseract + traineddata once per worker instead of on the first request.
+    from .ocr_engine import get_engine
+
+    try:
+        get_engine()
+    except Exception:
+        # Surface the error on the OCR call itself, where the API reports it.
+        pass
+
+
+def result_from_text(raw_text: str, timings: dict[str, float] | None = None) -> OcrResult:
+    t0 = time.perf_counter()
+    doc = parse_document(raw_text)
+    fields = extract_fields(doc)
+
+    # Line items are best-effort; never fail the whole upload because of them.
+    try:
+        items = extract_line_items(doc)
+    except Exception:
+        items = []
+
+    timings = dict(timings or {})
+    timings["extract"] = (time.perf_counter() - t0) * 1000.0
+    return OcrResult(raw_text=doc.text, fields=fields, items=items, timings=timings)
+
+
+def process_image(source: str | bytes, lang: str | None = None, pipeline: str | None = None) -> OcrResult:
+    """OCR + field extraction for one image (path or encoded bytes). Runs inside a pool worker."""
+
+    from .ocr import ocr_image
+
+    text, timings = ocr_image(source, lang=lang, pipeline=pipeline)
+    return result_from_text(text, timings)
+
+
+class OcrPool:
+    """Process pool with a bounded admission queue.
+
+    `submit` never blocks: when `queue_size` jobs are already running or waiting it
+    raises `OcrQueueFull` so the caller can shed load instead of piling up work.
+    """
+
+    def __init__(self, workers: int, queue_size: int, threads_per_worker: int = 1):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.queue_size = max(queue_size, 1)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(max(threads_per_worker, 1),),
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._pending >= self.queue_size:
+                raise OcrQueueFull(f"OCR queue is full ({self._pending}/{self.queue_size})")
+            self._pending += 1
+
+        try:
+            fut = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def run_queued(self, fn, *args, **kwargs):
+        """Like `run`, but waits for a free slot instead of raising OcrQueueFull."""
+
+        while True:
+            try:
+                fut = self.submit(fn, *args, **kwargs)
+            except OcrQueueFull:
+                await asyncio.sleep(0.2)
+                continue
+            return await asyncio.wrap_future(fut)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _release(self, _fut) -> None:
+        with self._lock:
+            self._pending -= 1
+
+
+_pool: OcrPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OcrPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                _pool = OcrPool(
+                    workers=ocr_process_count(settings),
+                    queue_size=settings.ocr_queue_size,
+                    threads_per_worker=settings.ocr_threads_per_worker,
+                )
+    return _pool
+
+
+def shutdown_ocr_pool(wait: bool = True) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+# Read without creating the pool, so a scrape never starts OCR workers.
+GaugeFunc("ocr_queue_depth", "OCR jobs running or waiting in the pool", lambda: _pool.depth if _pool else 0)
+GaugeFunc("ocr_queue_capacity", "OCR pool admission limit", lambda: _pool.queue_size if _pool else 0)
+GaugeFunc("ocr_workers", "OCR worker processes", lambda: _pool.workers if _pool else 0)
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Union
+
+import cv2
+import numpy as np
+
+from ..config import get_settings
+from .image_probe import PROBE_BYTES, inspect_image
+
+
+# A file path, or the encoded image itself (upload bytes / memoryview / uint8 array)
+ImageSource = Union[str, bytes, bytearray, memoryview, np.ndarray]
+
+
+_REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_reduction(width: int | None, height: int | None, min_long_side: int) -> int:
+    """Largest decode-time reduction (1/2/4/8) that keeps `min_long_side` pixels."""
+
+    if not width or not height or min_long_side <= 0:
+        return 1
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= min_long_side:
+            return factor
+    return 1
+
+
+def grayscale_decode_flags(reduction: int) -> int:
+    # JPEG scales in the DCT domain (cheap); other formats decode then shrink.
+    return _REDUCED_GRAYSCALE.get(reduction, cv2.IMREAD_GRAYSCALE)
+
+
+def _downsample(gray: np.ndarray, long_side: int) -> tuple[np.ndarray, float]:
+    h, w = gray.shape[:2]
+    scale = min(1.0, long_side / max(h, w))
+    if scale >= 1.0:
+        return gray, 1.0
+    small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def crop_to_receipt(gray: np.ndarray, min_area_ratio: float = 0.2, margin: float = 0.01) -> np.ndarray:
+    """Crop to the receipt paper (largest bright contour) before the expensive filters.
+
+    Works on a small copy of the frame; returns the input unchanged when no
+    plausible paper region is found or it already fills the frame.
+    """
+
+    small, scale = _downsample(gray, 800)
+    blur = cv2.GaussianBlur(small, (5, 5), 0)
+    _, mask = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Close the dark text lines so the paper becomes one blob.
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    sh, sw = small.shape[:2]
+    area_ratio = (w * h) / float(sw * sh)
+    if area_ratio < min_area_ratio or area_ratio > 0.95:
+        return gray
+
+    pad_x, pad_y = int(sw * margin), int(sh * margin)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(sw, x + w + pad_x), min(sh, y + h + pad_y)
+
+    H, W = gray.shape[:2]
+    return gray[
+        int(y0 / scale) : min(H, int(y1 / scale)),
+        int(x0 / scale) : min(W, int(x1 / scale)),
+    ]
+
+
+def estimate_text_height(gray: np.ndarray) -> float | None:
+    """Median glyph height in pixels, from connected components of a binarized copy."""
+
+    small, scale = _downsample(gray, 1200)
+    _, inv = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(inv, connectivity=8)
+    if n <= 1:
+        return None
+
+    sh = small.shape[0]
+    w = stats[1:, cv2.CC_STAT_WIDTH]
+    h = stats[1:, cv2.CC_STAT_HEIGHT]
+    area = stats[1:, cv2.CC_STAT_AREA]
+    glyph = (
+        (h >= 3)
+        & (h <= sh * 0.1)
+        & (w <= h * 3)
+        & (w * 10 >= h)
+        & (area >= 0.1 * w * h)
+    )
+    if int(glyph.sum()) < 20:
+        return None
+    return float(np.median(h[glyph])) / scale
+
+
+def normalize_resolution(gray: np.ndarray, target_text_height: int, max_long_side: int) -> np.ndarray:
+    """Rescale so glyphs are about `target_text_height` px tall (tesseract's sweet spot)."""
+
+    h, w = gray.shape[:2]
+    scale = 1.0
+    text_height = estimate_text_height(gray)
+    if text_height:
+        scale = target_text_height / text_height
+        # Leave near-target images alone; resampling only costs sharpness there.
+        if 0.85 <= scale <= 1.15:
+            scale = 1.0
+        scale = min(max(scale, 0.25), 3.0)
+
+    if max_long_side > 0 and max(h, w) * scale > max_long_side:
+        scale = max_long_side / float(max(h, w))
+
+    if scale == 1.0:
+        return gray
+
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=interpolation)
+
+
+def _as_buffer(source: ImageSource) -> tuple[np.ndarray, str]:
+    if isinstance(source, str):
+        # np.fromfile + imdecode also handles non-ASCII paths on Windows.
+        return np.fromfile(source, dtype=np.uint8), source
+    if isinstance(source, np.ndarray):
+        return source, "<buffer>"
+    return np.frombuffer(source, dtype=np.uint8), "<buffer>"
+
+
+def decode_image(source: ImageSource, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """Decode an encoded image straight from memory (or read a path once).
+
+    Buffers are wrapped with np.frombuffer, so the upload bytes are not copied
+    before cv2.imdecode.
+    """
+
+    buf, label = _as_buffer(source)
+    img = cv2.imdecode(buf, flags) if buf.size else None
+    if img is None:
+        raise ValueError(f"Cannot read image: {label}")
+    return img
+
+
+def decode_grayscale(source: ImageSource, min_long_side: int) -> np.ndarray:
+    buf, _ = _as_buffer(source)
+
+    # Header-only size probe picks the decode-time reduction (no full decode).
+    try:
+        info = inspect_image(buf[:PROBE_BYTES].tobytes())
+        width, height = info.width, info.height
+    except ValueError:
+        width = height = None
+    reduction = decode_reduction(width, height, min_long_side)
+    return decode_image(buf, grayscale_decode_flags(reduction))
+
+
+# --- Pipeline stages: (grayscale image, settings) -> image ---------------------------
+
+
+def _stage_crop(img: np.ndarray, settings) -> np.ndarray:
+    return crop_to_receipt(img, settings.ocr_crop_min_area)
+
+
+def _stage_normalize(img: np.ndarray, settings) -> np.ndarray:
+    return normalize_resolution(img, settings.ocr_target_text_height, settings.ocr_max_long_side)
+
+
+def _stage_bilateral(img: np.ndarray, settings) -> np.ndarray:
+    return cv2.bilateralFilter(img, d=7, sigmaColor=75, sigmaSpace=75)
+
+
+def _stage_gaussian(img: np.ndarray, settings) -> np.ndarray:
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+
+def _stage_median(img: np.ndarray, settings) -> np.ndarray:
+    return cv2.medianBlur(img, 3)
+
+
+def _stage_adaptive(img: np.ndarray, settings) -> np.ndarray:
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 9)
+
+
+def _stage_adaptive_fast(img: np.ndarray, settings) -> np.ndarray:
+    """Same idea as `adaptive`, but the Gaussian threshold map is computed at 1/4 scale."""
+
+    h, w = img.shape[:2]
+    small = cv2.resize(img, (max(1, w // 4), max(1, h // 4)), interpolation=cv2.INTER_AREA)
+    # sigma 5 at full scale == the 31x31 Gaussian window of `adaptive`
+    local = cv2.GaussianBlur(small, (0, 0), 5 / 4)
+    local = cv2.resize(local, (w, h), interpolation=cv2.INTER_LINEAR)
+    return cv2.compare(img, cv2.subtract(local, 9), cv2.CMP_GT)
+
+
+def _stage_otsu(img: np.ndarray, settings) -> np.ndarray:
+    _, thr = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thr
+
+
+STAGES: dict[str, Callable[[np.ndarray, object], np.ndarray]] = {
+    "crop": _stage_crop,
+    "normalize": _stage_normalize,
+    "bilateral": _stage_bilateral,
+    "gaussian": _stage_gaussian,
+    "median": _stage_median,
+    "adaptive": _stage_adaptive,
+    "adaptive_fast": _stage_adaptive_fast,
+    "otsu": _stage_otsu,
+}
+
+
+def parse_pipeline(spec: str | None = None) -> list[str]:
+    """Split a comma-separated stage list (default: the OCR_PIPELINE setting).
+
+    Raises ValueError for unknown stage names.
+    """
+
+    if spec is None or not spec.strip():
+        spec = get_settings().ocr_pipeline
+    stages = [x.strip().lower() for x in spec.split(",") if x.strip()]
+    unknown = [x for x in stages if x not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown preprocessing stage(s): {', '.join(unknown)}. Available: {', '.join(STAGES)}")
+    return stages
+
+
+@dataclass
+class PipelineResult:
+    image: np.ndarray
+    # Wall time per stage in milliseconds, in execution order (including "decode")
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def run_pipeline(source: ImageSource, spec: str | None = None) -> PipelineResult:
+    settings = get_settings()
+    stages = parse_pipeline(spec)
+    timings: dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    img = decode_grayscale(source, settings.ocr_decode_long_side)
+    timings["decode"] = (time.perf_counter() - t0) * 1000.0
+
+    for name in stages:
+        t0 = time.perf_counter()
+        img = STAGES[name](img, settings)
+        # A stage may repeat (e.g. two blurs); keep the total per name.
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000.0
+
+    return PipelineResult(image=img, timings=timings)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import cv2
+import numpy as np
+
+
+def ocr_process_count(settings) -> int:
+    """OCR worker processes: OCR_WORKERS, or as many as the cores allow (0).
+
+    In `regions` mode every process runs up to `ocr_region_threads` tesseract
+    calls at once, so the default leaves that many cores per process.
+    """
+
+    if settings.ocr_workers > 0:
+        return settings.ocr_workers
+    cpus = os.cpu_count() or 1
+    if settings.ocr_mode == "regions":
+        return max(1, cpus // max(1, settings.ocr_region_threads))
+    return cpus
+
+
+def region_thread_count(settings) -> int:
+    # Capped by the cores left per OCR process, so processes x threads stays within the CPU count.
+    per_process = (os.cpu_count() or 1) // ocr_process_count(settings)
+    return max(1, min(settings.ocr_region_threads, per_process))
+
+
+def _binarize(page: np.ndarray) -> np.ndarray:
+    gray = page if page.ndim == 2 else cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+    # Leaves a page the pipeline already thresholded as it is.
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def find_line_bands(page: np.ndarray) -> list[tuple[int, int]]:
+    """Vertical extents (y0, y1) of text lines in a page (dark text on a light background).
+
+    The page is binarized first (Otsu), whether or not the pipeline ended with
+    a threshold stage. Glyphs are smeared horizontally so every printed line
+    (item name, qty and price columns included) becomes one blob; overlapping
+    blobs are merged.
+    """
+
+    binary = _binarize(page)
+    h, w = binary.shape[:2]
+    ink = cv2.bitwise_not(binary)
+    # Drop isolated specks so they don't create one-pixel "lines".
+    ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2)))
+
+    # Paper edges and vertical rules would tie every line together once smeared.
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    tall = np.flatnonzero(stats[:, cv2.CC_STAT_HEIGHT] > max(40, h // 10))
+    tall = tall[tall != 0]
+    if tall.size:
+        ink[np.isin(labels, tall)] = 0
+
+    smeared = cv2.dilate(ink, cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, w // 30), 1)))
+
+    n, _, stats, _ = cv2.connectedComponentsWithStats(smeared, connectivity=8)
+    boxes = sorted(
+        (int(stats[i, cv2.CC_STAT_TOP]), int(stats[i, cv2.CC_STAT_TOP] + stats[i, cv2.CC_STAT_HEIGHT]))
+        for i in range(1, n)
+        if stats[i, cv2.CC_STAT_WIDTH] >= 8 and stats[i, cv2.CC_STAT_HEIGHT] >= 4
+    )
+
+    bands: list[tuple[int, int]] = []
+    for y0, y1 in boxes:
+        if bands and y0 <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bands[-1][1], y1))
+        else:
+            bands.append((y0, y1))
+    return bands
+
+
+def split_into_strips(bands: list[tuple[int, int]], parts: int, height: int) -> list[tuple[int, int]]:
+    """Group consecutive line bands into `parts` strips of similar height.
+
+    Cuts fall in the gap between two lines, so no line is split across strips;
+    the first and last strips extend to the page edges so nothing is dropped.
+    """
+
+    if not bands:
+        return []
+    parts = max(1, min(parts, len(bands)))
+    total = sum(y1 - y0 for y0, y1 in bands)
+    target = total / parts
+
+    groups: list[list[tuple[int, int]]] = [[]]
+    acc = 0
+    for band in bands:
+        if groups[-1] and acc >= target and len(groups) < parts:
+            groups.append([])
+            acc = 0
+        groups[-1].append(band)
+        acc += band[1] - band[0]
+
+    strips: list[tuple[int, int]] = []
+    for i, group in enumerate(groups):
+        top = 0 if i == 0 else (groups[i - 1][-1][1] + group[0][0]) // 2
+        bottom = height if i == len(groups) - 1 else (group[-1][1] + groups[i + 1][0][0]) // 2
+        strips.append((top, bottom))
+    return strips
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(threads: int) -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ocr-region")
+    return _executor
+
+
+def ocr_by_regions(
+    page: np.ndarray,
+    recognize: Callable[[np.ndarray], str],
+    threads: int,
+    strips_per_thread: int = 2,
+) -> str:
+    """OCR horizontal text strips concurrently and join them in reading order.
+
+    `recognize` must be safe to call from several threads at once (one engine
+    per thread). Pages with too few lines are recognized in one call.
+    """
+
+    if threads <= 1:
+        # Strips recognized one after another are no faster than the page.
+        return recognize(page)
+
+    h = page.shape[0]
+    bands = find_line_bands(page)
+    strips = split_into_strips(bands, threads * strips_per_thread, h)
+    if len(strips) < 2:
+        return recognize(page)
+
+    executor = _get_executor(threads)
+    texts = list(executor.map(lambda s: recognize(page[s[0] : s[1]]), strips))
+    return "\n".join(t.strip() for t in texts if t and t.strip())
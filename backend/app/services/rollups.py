@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from ..models import CategoryDailyTotal, ItemDailySpending, ItemSpending, Receipt, ReceiptItem
+from .text import item_key
+from .versions import receipts_changed
+
+
+CATEGORY_GROUPS = ("Ăn uống", "Mua sắm", "Khác")
+
+_FOOD_WORDS = ("ăn", "uống", "cafe", "coffee", "trà", "tea", "nhà hàng", "quán", "food")
+
+UNKNOWN_ITEM = "(Không rõ)"
+
+# Incremental change to the rollup: (group, day) -> [total, receipt_count]
+CategoryDeltas = dict[tuple[str, date], list]
+
+# (item_key, day) -> [total_spent, line_count, display name]
+ItemDeltas = dict[tuple[str, date], list]
+
+# (item_name, total_price) of a line item
+ItemValues = tuple[str | None, float | None]
+
+
+def category_group(category: str | None) -> str:
+    c = (category or "").strip().lower()
+    if not c:
+        return "Khác"
+
+    # Heuristic for demo: treat food/drink as "Ăn uống", everything else as "Mua sắm".
+    if any(k in c for k in _FOOD_WORDS):
+        return "Ăn uống"
+
+    return "Mua sắm"
+
+
+def as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    # SQLite returns DATE() as text
+    return date.fromisoformat(str(value))
+
+
+def upsert_add(
+    db: Session,
+    model: type,
+    keys: list[str],
+    rows: list[dict],
+    add: list[str] | None = None,
+    replace: list[str] | None = None,
+) -> None:
+    """Insert `rows`, or add their `add` values (default: all non-key values) onto
+    the existing row with the same key, overwriting the `replace` columns. Other
+    columns are only set on insert.
+
+    One statement per batch (ON DUPLICATE KEY UPDATE / ON CONFLICT DO UPDATE),
+    so concurrent writers never lose an increment.
+    """
+
+    if not rows:
+        return
+    # Same lock order in every transaction (no deadlocks between writers on MySQL).
+    rows = sorted(rows, key=lambda r: tuple(r[k] for k in keys))
+    table = model.__table__
+    replace = replace or []
+    values = add if add is not None else [c for c in rows[0] if c not in keys and c not in replace]
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            {**{c: table.c[c] + stmt.inserted[c] for c in values}, **{c: stmt.inserted[c] for c in replace}}
+        )
+    elif dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                **{c: table.c[c] + stmt.excluded[c] for c in values},
+                **{c: stmt.excluded[c] for c in replace},
+            },
+        )
+    else:
+        raise RuntimeError(f"Rollup upsert not supported on {dialect}")
+
+    db.execute(stmt, rows)
+
+
+def add_receipt_delta(
+    deltas: CategoryDeltas, group: str | None, day, amount: float | None, count: int = 1
+) -> None:
+    """Record `count` receipts worth `amount` in total (both negative to remove)."""
+
+    key = (group or "Khác", as_date(day))
+    entry = deltas.setdefault(key, [0.0, 0])
+    entry[0] += float(amount or 0.0)
+    entry[1] += count
+
+
+def apply_category_deltas(db: Session, deltas: CategoryDeltas) -> None:
+    """Apply rollup changes in the caller's transaction (next to the receipt writes)."""
+
+    rows = [
+        {"group_name": group, "day": day, "total": total, "receipt_count": count}
+        for (group, day), (total, count) in deltas.items()
+        if total or count
+    ]
+    upsert_add(db, CategoryDailyTotal, ["group_name", "day"], rows)
+
+
+def add_item_delta(deltas: ItemDeltas, name: str | None, day, amount: float | None, count: int = 1) -> None:
+    key = (item_key(name), as_date(day))
+    entry = deltas.setdefault(key, [0.0, 0, name])
+    entry[0] += float(amount or 0.0)
+    entry[1] += count
+
+
+def apply_item_deltas(db: Session, deltas: ItemDeltas) -> None:
+    daily = []
+    totals: dict[str, list] = {}
+    for (key, day), (amount, count, name) in deltas.items():
+        if not (amount or count):
+            continue
+        daily.append({"item_key": key, "day": day, "total_spent": amount, "line_count": count})
+        entry = totals.setdefault(key, [0.0, 0, name])
+        entry[0] += amount
+        entry[1] += count
+
+    upsert_add(db, ItemDailySpending, ["item_key", "day"], daily)
+    upsert_add(
+        db,
+        ItemSpending,
+        ["item_key"],
+        [
+            {"item_key": key, "item_name": name, "total_spent": amount, "line_count": count}
+            for key, (amount, count, name) in totals.items()
+        ],
+        add=["total_spent", "line_count"],
+    )
+
+
+def items_replaced(
+    db: Session, day, old: Iterable[ItemValues] = (), new: Iterable[ItemValues] = ()
+) -> None:
+    """Move a receipt's line items from `old` to `new` in the item rollups."""
+
+    deltas: ItemDeltas = {}
+    for name, total in old:
+        add_item_delta(deltas, name, day, -(total or 0.0), count=-1)
+    for name, total in new:
+        add_item_delta(deltas, name, day, total)
+    apply_item_deltas(db, deltas)
+
+
+def receipts_added(db: Session, receipts: Iterable[Receipt]) -> None:
+    """Count flushed receipts (created_at is set) and their items into the rollups."""
+
+    deltas: CategoryDeltas = {}
+    item_deltas: ItemDeltas = {}
+    for r in receipts:
+        add_receipt_delta(deltas, r.category_group, r.created_at, r.total_amount)
+        for it in r.items:
+            add_item_delta(item_deltas, it.item_name, r.created_at, it.total_price)
+    apply_category_deltas(db, deltas)
+    apply_item_deltas(db, item_deltas)
+
+
+def receipts_removed(db: Session, receipts: Iterable[Receipt]) -> None:
+    """Take receipts and their items out of the rollups; call before deleting them."""
+
+    deltas: CategoryDeltas = {}
+    item_deltas: ItemDeltas = {}
+    for r in receipts:
+        add_receipt_delta(deltas, r.category_group, r.created_at, -(r.total_amount or 0.0), count=-1)
+        for it in r.items:
+            add_item_delta(item_deltas, it.item_name, r.created_at, -(it.total_price or 0.0), count=-1)
+    apply_category_deltas(db, deltas)
+    apply_item_deltas(db, item_deltas)
+
+
+def read_category_totals(db: Session) -> dict[str, float]:
+    totals = {group: 0.0 for group in CATEGORY_GROUPS}
+    rows = db.execute(
+        select(CategoryDailyTotal.group_name, func.sum(CategoryDailyTotal.total)).group_by(
+            CategoryDailyTotal.group_name
+        )
+    ).all()
+    for group, total in rows:
+        totals[group] = totals.get(group, 0.0) + float(total or 0.0)
+    return totals
+
+
+def _backfill_groups(db: Session) -> int:
+    # One UPDATE per distinct category, not per receipt.
+    categories = db.execute(select(Receipt.category).distinct()).scalars().all()
+    changed = 0
+    for category in categories:
+        group = category_group(category)
+        category_filter = Receipt.category == category if category is not None else Receipt.category.is_(None)
+        result = db.execute(
+            update(Receipt)
+            .where(category_filter)
+            .where((Receipt.category_group != group) | Receipt.category_group.is_(None))
+            .values(category_group=group)
+        )
+        changed += result.rowcount or 0
+    return changed
+
+
+def _recompute(db: Session) -> dict[tuple[str, date], tuple[float, int]]:
+    day = func.date(Receipt.created_at)
+    rows = db.execute(
+        select(
+            Receipt.category_group,
+            day,
+            func.coalesce(func.sum(Receipt.total_amount), 0.0),
+            func.count(Receipt.id),
+        ).group_by(Receipt.category_group, day)
+    ).all()
+    out: dict[tuple[str, date], tuple[float, int]] = defaultdict(lambda: (0.0, 0))
+    for group, d, total, count in rows:
+        key = (group or "Khác", as_date(d))
+        prev_total, prev_count = out[key]
+        out[key] = (prev_total + float(total), prev_count + int(count))
+    return dict(out)
+
+
+def rebuild_category_totals(db: Session) -> dict[str, int]:
+    """Recompute `category_group` and the whole rollup from `receipts` in one transaction."""
+
+    groups_fixed = _backfill_groups(db)
+    db.execute(delete(CategoryDailyTotal))
+    rows = [
+        {"group_name": group, "day": day, "total": total, "receipt_count": count}
+        for (group, day), (total, count) in _recompute(db).items()
+    ]
+    if rows:
+        db.execute(CategoryDailyTotal.__table__.insert(), rows)
+    receipts_changed(db)
+    db.commit()
+    return {"groups_fixed": groups_fixed, "rows": len(rows)}
+
+
+def check_category_totals(db: Session, tolerance: float = 0.01) -> list[dict]:
+    """Compare the rollup with a full recompute; returns the (group, day) rows that differ."""
+
+    stored = {
+        (r.group_name, as_date(r.day)): (float(r.total), int(r.receipt_count))
+        for r in db.execute(
+            select(
+                CategoryDailyTotal.group_name,
+                CategoryDailyTotal.day,
+                CategoryDailyTotal.total,
+                CategoryDailyTotal.receipt_count,
+            )
+        )
+    }
+    expected = _recompute(db)
+
+    mismatches = []
+    for key in sorted(stored.keys() | expected.keys()):
+        have_total, have_count = stored.get(key, (0.0, 0))
+        want_total, want_count = expected.get(key, (0.0, 0))
+        if have_count != want_count or abs(have_total - want_total) > tolerance:
+            mismatches.append(
+                {
+                    "group": key[0],
+                    "day": key[1].isoformat(),
+                    "expected_total": want_total,
+                    "rollup_total": have_total,
+                    "expected_count": want_count,
+                    "rollup_count": have_count,
+                }
+            )
+    return mismatches
+
+
+def read_item_spending(
+    db: Session,
+    limit: int,
+    offset: int = 0,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> list[dict]:
+    """Items by spending, highest first. Without a date window this is an index
+    scan of `item_spending`; with one, a range of `item_daily_spending` days.
+    """
+
+    if date_from is None and date_to is None:
+        rows = db.execute(
+            select(ItemSpending.item_key, ItemSpending.item_name, ItemSpending.total_spent)
+            .where(ItemSpending.line_count > 0)
+            .order_by(ItemSpending.total_spent.desc(), ItemSpending.item_key)
+            .limit(limit)
+            .offset(offset)
+        ).all()
+    else:
+        spent = func.sum(ItemDailySpending.total_spent)
+        query = select(ItemDailySpending.item_key, spent).group_by(ItemDailySpending.item_key)
+        if date_from is not None:
+            query = query.where(ItemDailySpending.day >= date_from)
+        if date_to is not None:
+            query = query.where(ItemDailySpending.day <= date_to)
+        ranked = db.execute(
+            query.having(func.sum(ItemDailySpending.line_count) > 0)
+            .order_by(spent.desc(), ItemDailySpending.item_key)
+            .limit(limit)
+            .offset(offset)
+        ).all()
+        names: dict[str, str | None] = {}
+        if ranked:
+            names = dict(
+                db.execute(
+                    select(ItemSpending.item_key, ItemSpending.item_name).where(
+                        ItemSpending.item_key.in_([key for key, _ in ranked])
+                    )
+                ).all()
+            )
+        rows = [(key, names.get(key), total) for key, total in ranked]
+
+    return [
+        {
+            "item_key": key,
+            "item_name": (name if key else None) or UNKNOWN_ITEM,
+            "total_spent": float(total or 0.0),
+        }
+        for key, name, total in rows
+    ]
+
+
+def _backfill_item_keys(db: Session, batch_size: int = 5000) -> int:
+    # Keyset over ids, one commit per batch; only missing or stale keys are written.
+    changed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(ReceiptItem.id, ReceiptItem.item_name, ReceiptItem.item_key)
+            .where(ReceiptItem.id > last_id)
+            .order_by(ReceiptItem.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return changed
+        updates = [
+            {"id": r.id, "item_key": key}
+            for r in rows
+            if (key := item_key(r.item_name)) != r.item_key
+        ]
+        if updates:
+            db.execute(update(ReceiptItem), updates)
+            db.commit()
+            changed += len(updates)
+        last_id = rows[-1].id
+
+
+def _recompute_items(db: Session) -> dict[tuple[str, date], tuple[float, int]]:
+    day = func.date(Receipt.created_at)
+    key = func.coalesce(ReceiptItem.item_key, "")
+    rows = db.execute(
+        select(
+            key,
+            day,
+            func.coalesce(func.sum(ReceiptItem.total_price), 0.0),
+            func.count(ReceiptItem.id),
+        )
+        .join(Receipt, Receipt.id == ReceiptItem.receipt_id)
+        .group_by(key, day)
+    ).all()
+    out: dict[tuple[str, date], tuple[float, int]] = {}
+    for k, d, total, count in rows:
+        prev_total, prev_count = out.get((k, as_date(d)), (0.0, 0))
+        out[(k, as_date(d))] = (prev_total + float(total), prev_count + int(count))
+    return out
+
+
+def rebuild_item_spending(db: Session) -> dict[str, int]:
+    """Recompute `item_key` (in batches), then both item rollups from
+    `receipt_items` in one transaction.
+    """
+
+    keys_fixed = _backfill_item_keys(db)
+    db.execute(delete(ItemDailySpending))
+    db.execute(delete(ItemSpending))
+
+    daily = _recompute_items(db)
+    totals: dict[str, list] = {}
+    for (key, _), (total, count) in daily.items():
+        entry = totals.setdefault(key, [0.0, 0])
+        entry[0] += total
+        entry[1] += count
+    names = dict(
+        db.execute(
+            select(func.coalesce(ReceiptItem.item_key, ""), func.min(ReceiptItem.item_name)).group_by(
+                func.coalesce(ReceiptItem.item_key, "")
+            )
+        ).all()
+    )
+
+    if daily:
+        db.execute(
+            ItemDailySpending.__table__.insert(),
+            [
+                {"item_key": key, "day": day, "total_spent": total, "line_count": count}
+                for (key, day), (total, count) in daily.items()
+            ],
+        )
+    if totals:
+        db.execute(
+            ItemSpending.__table__.insert(),
+            [
+                {"item_key": key, "item_name": names.get(key), "total_spent": total, "line_count": count}
+                for key, (total, count) in totals.items()
+            ],
+        )
+    receipts_changed(db)
+    db.commit()
+    return {"keys_fixed": keys_fixed, "rows": len(daily), "items": len(totals)}
+
+
+def check_item_spending(db: Session, tolerance: float = 0.01) -> list[dict]:
+    """Compare both item rollups with a full recompute; returns the rows that differ."""
+
+    expected = _recompute_items(db)
+    stored = {
+        (r.item_key, as_date(r.day)): (float(r.total_spent), int(r.line_count))
+        for r in db.execute(
+            select(
+                ItemDailySpending.item_key,
+                ItemDailySpending.day,
+                ItemDailySpending.total_spent,
+                ItemDailySpending.line_count,
+            )
+        )
+    }
+    expected_totals: dict[str, tuple[float, int]] = {}
+    for (key, _), (total, count) in expected.items():
+        prev_total, prev_count = expected_totals.get(key, (0.0, 0))
+        expected_totals[key] = (prev_total + total, prev_count + count)
+    stored_totals = {
+        r.item_key: (float(r.total_spent), int(r.line_count))
+        for r in db.execute(select(ItemSpending.item_key, ItemSpending.total_spent, ItemSpending.line_count))
+    }
+
+    mismatches = []
+    for label, have, want in (("day", stored, expected), ("all", stored_totals, expected_totals)):
+        for key in sorted(have.keys() | want.keys()):
+            have_total, have_count = have.get(key, (0.0, 0))
+            want_total, want_count = want.get(key, (0.0, 0))
+            if have_count != want_count or abs(have_total - want_total) > tolerance:
+                item, day = key if label == "day" else (key, None)
+                mismatches.append(
+                    {
+                        "item_key": item,
+                        "day": day.isoformat() if day else "all",
+                        "expected_total": want_total,
+                        "rollup_total": have_total,
+                        "expected_count": want_count,
+                        "rollup_count": have_count,
+                    }
+                )
+    return mismatches
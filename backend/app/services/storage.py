@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Iterator
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..db import SessionLocal
+from ..models import ImageBlob, IngestJob, Receipt
+from .rollups import upsert_add
+from .versions import receipts_changed
+
+
+# Stored image_path values are "uploads/<key>", which is also their URL path.
+# Rows from before content addressing hold a file path in the flat UPLOAD_DIR.
+URL_PREFIX = "uploads/"
+
+_CONTENT_KEY = re.compile(r"[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z]+")
+
+
+class StorageUnavailable(RuntimeError):
+    pass
+
+
+class RangeNotSatisfiable(ValueError):
+    def __init__(self, size: int | None):
+        super().__init__("Requested range not satisfiable")
+        # Object size, when the backend reports it
+        self.size = size
+
+
+def content_key(sha256: str, ext: str) -> str:
+    # Two levels of 256 shards keep every directory small even at tens of millions of images.
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def image_path_for(key: str) -> str:
+    return URL_PREFIX + key
+
+
+def key_of(image_path: str) -> str:
+    path = image_path.replace("\\", "/")
+    if path.startswith(URL_PREFIX):
+        return path[len(URL_PREFIX) :]
+    return path.rsplit("/", 1)[-1]
+
+
+def media_type(key: str) -> str:
+    if key.endswith(".webp"):
+        return "image/webp"
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+@dataclass
+class StoredObject:
+    body: Iterator[bytes]
+    length: int
+    etag: str
+    # Set when a byte range was requested and served
+    content_range: str | None = None
+
+
+class LocalImageStore:
+    """Images as files under `root` (UPLOAD_DIR)."""
+
+    local = True
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).is_file()
+
+    def put_file(self, key: str, src: Path) -> None:
+        """Move `src` (a temp file on the same disk) to `key`; dropped if the key already exists."""
+
+        dest = self.local_path(key)
+        if dest.is_file():
+            src.unlink(missing_ok=True)
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dest)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        dest = self.local_path(key)
+        if dest.is_file():
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so a concurrent reader never sees half a file.
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def load(self, key: str) -> str | bytes:
+        # A path is enough for cv2 and cheaper to hand to an OCR worker process.
+        return str(self.local_path(key))
+
+    def read(self, key: str) -> bytes:
+        return self.local_path(key).read_bytes()
+
+    def delete(self, key: str) -> None:
+        self.local_path(key).unlink(missing_ok=True)
+
+
+class S3ImageStore:
+    """Images as objects in an S3-compatible bucket (AWS, MinIO, ...)."""
+
+    local = False
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise StorageUnavailable("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        if not bucket:
+            raise StorageUnavailable("STORAGE_BACKEND=s3 requires S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client_error = ClientError
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+
+    def _missing(self, e: Exception) -> bool:
+        return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self._client_error as e:
+            if self._missing(e):
+                return False
+            raise
+        return True
+
+    def put_file(self, key: str, src: Path) -> None:
+        try:
+            if not self.exists(key):
+                self._client.upload_file(
+                    str(src), self.bucket, self.prefix + key, ExtraArgs={"ContentType": media_type(key)}
+                )
+        finally:
+            src.unlink(missing_ok=True)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        if not self.exists(key):
+            self._client.put_object(
+                Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=media_type(key)
+            )
+
+    def load(self, key: str) -> str | bytes:
+        return self.read(key)
+
+    def read(self, key: str) -> bytes:
+        return self._client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+
+    def open(self, key: str, byte_range: str | None = None) -> StoredObject | None:
+        """Stream an object (or the `Range: bytes=...` part of it); None when missing.
+
+        Raises RangeNotSatisfiable when the range lies outside the object.
+        """
+
+        kwargs = {"Range": byte_range} if byte_range else {}
+        try:
+            obj = self._client.get_object(Bucket=self.bucket, Key=self.prefix + key, **kwargs)
+        except self._client_error as e:
+            if self._missing(e):
+                return None
+            error = e.response.get("Error", {})
+            if error.get("Code") == "InvalidRange":
+                size = error.get("ActualObjectSize")
+                raise RangeNotSatisfiable(int(size) if size else None) from e
+            raise
+        return StoredObject(
+            body=obj["Body"].iter_chunks(64 * 1024),
+            length=obj["ContentLength"],
+            etag=obj["ETag"],
+            content_range=obj.get("ContentRange") if byte_range else None,
+        )
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+ImageStore = LocalImageStore | S3ImageStore
+
+
+@lru_cache
+def get_image_store() -> ImageStore:
+    settings = get_settings()
+    backend = settings.storage_backend.strip().lower()
+    if backend == "local":
+        return LocalImageStore(settings.upload_dir)
+    if backend == "s3":
+        return S3ImageStore(
+            settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+        )
+    raise StorageUnavailable(f"Unknown STORAGE_BACKEND '{settings.storage_backend}' (local, s3)")
+
+
+def temp_upload_path() -> Path:
+    # Scratch space for streamed uploads; always local, whatever the backend.
+    tmp_dir = Path(get_settings().upload_dir) / ".tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    return tmp_dir / f"{uuid.uuid4().hex}.part"
+
+
+# --- Reference counts --------------------------------------------------------------
+
+
+def _upsert_blobs(db: Session, refs: dict[str, int]) -> None:
+    now = datetime.utcnow()
+    upsert_add(
+        db,
+        ImageBlob,
+        ["key"],
+        [{"key": k, "refcount": n, "updated_at": now} for k, n in refs.items()],
+        add=["refcount"],
+        replace=["updated_at"],
+    )
+
+
+def track_image(key: str) -> None:
+    """Record an image as used now, before it is written to the store.
+
+    Every stored image then has a row, even when the upload fails before
+    counting a reference (those are left to images-gc), and an image that is
+    about to be deduplicated onto gets a fresh grace period.
+    """
+
+    with SessionLocal() as db:
+        _upsert_blobs(db, {key: 0})
+        db.commit()
+
+
+def add_image_refs(db: Session, image_paths: Iterable[str]) -> None:
+    """Count new references (in the caller's transaction) to content-addressed images."""
+
+    _upsert_blobs(db, Counter(key for key in map(key_of, image_paths) if _CONTENT_KEY.fullmatch(key)))
+
+
+def release_image(db: Session, image_path: str) -> None:
+    db.execute(
+        update(ImageBlob)
+        .where(ImageBlob.key == key_of(image_path))
+        .values(refcount=ImageBlob.refcount - 1, updated_at=datetime.utcnow())
+    )
+
+
+def collect_garbage(db: Session, grace: timedelta = timedelta(hours=24)) -> int:
+    """Delete images unreferenced and unused for longer than `grace`; returns how many.
+
+    Storing, referencing and releasing an image all restart its grace period,
+    which covers an upload between storing its image (possibly found already
+    stored) and counting its reference.
+    """
+
+    from .thumbnails import SIZES, derivative_key
+
+    store = get_image_store()
+    cutoff = datetime.utcnow() - grace
+    keys = db.scalars(
+        select(ImageBlob.key).where(ImageBlob.refcount <= 0, ImageBlob.updated_at < cutoff)
+    ).all()
+
+    removed = 0
+    for key in keys:
+        # Re-checked in the DELETE: a new reference may have arrived since the select.
+        res = db.execute(delete(ImageBlob).where(ImageBlob.key == key, ImageBlob.refcount <= 0))
+        db.commit()
+        if res.rowcount:
+            store.delete(key)
+            stem = PurePosixPath(key).stem
+            for size in SIZES:
+                store.delete(derivative_key(size, stem))
+            removed += 1
+    return removed
+
+
+# --- Images stored before content addressing ------------------------------------------
+
+
+def migrate_legacy_images(db: Session, batch_size: int = 500) -> int:
+    """Move images referenced by flat UPLOAD_DIR paths into the image store.
+
+    Receipts (and finished jobs) are repointed to the content-addressed key,
+    identical images collapse into one, and the old file is removed. Run it
+    with the ingest queue drained. Returns the number of files moved; paths
+    whose file is missing are left as they are.
+    """
+
+    settings = get_settings()
+    store = get_image_store()
+    legacy = ~Receipt.image_path.like(f"{URL_PREFIX}%/%/%")
+
+    moved = 0
+    last = ""
+    while True:
+        paths = db.scalars(
+            select(Receipt.image_path)
+            .where(legacy, Receipt.image_path > last)
+            .distinct()
+            .order_by(Receipt.image_path)
+            .limit(batch_size)
+        ).all()
+        if not paths:
+            return moved
+        last = paths[-1]
+
+        done: list[Path] = []
+        for old in paths:
+            src = Path(settings.upload_dir) / key_of(old)
+            if not src.is_file():
+                continue
+            data = src.read_bytes()
+            new = image_path_for(content_key(hashlib.sha256(data).hexdigest(), src.suffix.lower()))
+            store.put_bytes(key_of(new), data)
+
+            refs = db.execute(update(Receipt).where(Receipt.image_path == old).values(image_path=new)).rowcount
+            db.execute(update(IngestJob).where(IngestJob.image_path == old).values(image_path=new))
+            add_image_refs(db, [new] * refs)
+            done.append(src)
+
+        receipts_changed(db)
+        db.commit()
+        for src in done:
+            src.unlink(missing_ok=True)
+        moved += len(done)
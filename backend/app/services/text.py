@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+
+
+_NON_WORD_RE = re.compile(r"[^0-9a-z]+")
+
+ITEM_KEY_LENGTH = 255
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics ("Phúc Long" -> "phuc long")."""
+
+    text = text.strip().lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def item_key(name: str | None) -> str:
+    """Grouping key for a line item name: folded, punctuation/OCR noise dropped,
+    whitespace collapsed ("Bánh  mì." and "BANH MI" -> "banh mi"). "" when nothing is left.
+    """
+
+    if not name:
+        return ""
+    return _NON_WORD_RE.sub(" ", fold(name)).strip()[:ITEM_KEY_LENGTH]
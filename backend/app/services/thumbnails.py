@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import re
+from pathlib import PurePosixPath
+
+import cv2
+import numpy as np
+
+from ..config import get_settings
+from .image_probe import IMAGE_EXTS, PROBE_BYTES, inspect_image
+from .metrics import STAGE_DURATION
+from .preprocess import decode_image, decode_reduction
+from .storage import ImageStore, content_key, get_image_store, key_of
+
+
+# Long side (px) per derivative. Served URLs are cached as immutable, so a
+# different size needs a new name here rather than new pixels under an old one.
+SIZES = {"thumb": 320, "view": 1280}
+
+WEBP_QUALITY = 80
+
+# Key prefix in the image store, next to the originals
+DERIVED_DIR = ".derived"
+
+_REDUCED_COLOR = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def derivative_key(size: str, stem: str) -> str:
+    return f"{DERIVED_DIR}/{size}/{stem}.webp"
+
+
+def find_original(store: ImageStore, stem: str) -> str | None:
+    # A few lookups instead of listing a directory (or bucket) that may hold millions of images.
+    for ext in IMAGE_EXTS:
+        key = content_key(stem, ext) if _SHA256.fullmatch(stem) else f"{stem}{ext}"
+        if store.exists(key):
+            return key
+    return None
+
+
+def _shrink(img: np.ndarray, long_side: int) -> np.ndarray:
+    h, w = img.shape[:2]
+    scale = long_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def make_derivatives(
+    store: ImageStore, source: str | bytes, stem: str, sizes: tuple[str, ...] = tuple(SIZES)
+) -> dict[str, str]:
+    """Store WebP derivatives of one original (a local path or its bytes); returns their keys by size.
+
+    The original is decoded once, at the largest decode-time reduction that
+    still covers the biggest requested size; smaller sizes are resized from
+    the previous one.
+    """
+
+    buf = np.fromfile(source, dtype=np.uint8) if isinstance(source, str) else np.frombuffer(source, dtype=np.uint8)
+    try:
+        info = inspect_image(buf[:PROBE_BYTES].tobytes())
+        width, height = info.width, info.height
+    except ValueError:
+        width = height = None
+
+    wanted = sorted(sizes, key=SIZES.__getitem__, reverse=True)
+    reduction = decode_reduction(width, height, SIZES[wanted[0]])
+    img = decode_image(buf, _REDUCED_COLOR.get(reduction, cv2.IMREAD_COLOR))
+
+    keys: dict[str, str] = {}
+    for size in wanted:
+        img = _shrink(img, SIZES[size])
+        ok, encoded = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY])
+        if not ok:
+            raise ValueError(f"WebP encoding failed: {stem}")
+        keys[size] = derivative_key(size, stem)
+        store.put_bytes(keys[size], encoded.tobytes())
+    return keys
+
+
+def ensure_derivative(store: ImageStore, size: str, stem: str) -> str | None:
+    """Key of a derivative, generated on the spot when missing (None: no such original)."""
+
+    key = derivative_key(size, stem)
+    if store.exists(key):
+        return key
+    original = find_original(store, stem)
+    if original is None:
+        return None
+    return make_derivatives(store, store.load(original), stem, (size,))[size]
+
+
+def create_derivatives(image_path: str, content: bytes | None = None) -> None:
+    if not get_settings().image_derivatives:
+        return
+
+    # Best-effort: a missing derivative is generated when first requested.
+    try:
+        with STAGE_DURATION.time("derivatives"):
+            store = get_image_store()
+            key = key_of(image_path)
+            make_derivatives(store, content or store.load(key), PurePosixPath(key).stem)
+    except Exception:
+        pass
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Receipt
+from .extract import parse_receipt_date
+from .rollups import as_date
+from .versions import receipts_changed
+
+
+PERIODS = ("daily", "weekly", "monthly")
+
+# Window used when the caller gives no start date
+_DEFAULT_SPAN = {"daily": 30, "weekly": 12, "monthly": 12}
+
+MAX_BUCKETS = 1000
+
+
+def backfill_purchased_at(db: Session, batch_size: int = 5000, reparse: bool = False) -> int:
+    """Fill `purchased_at` from `date` (only empty ones unless `reparse`), one commit per batch."""
+
+    changed = 0
+    last_id = 0
+    while True:
+        query = select(Receipt.id, Receipt.date, Receipt.purchased_at).where(Receipt.id > last_id)
+        if not reparse:
+            query = query.where(Receipt.purchased_at.is_(None), Receipt.date.is_not(None))
+        rows = db.execute(query.order_by(Receipt.id).limit(batch_size)).all()
+        if not rows:
+            return changed
+        updates = [
+            {"id": r.id, "purchased_at": parsed}
+            for r in rows
+            if (parsed := parse_receipt_date(r.date)) != r.purchased_at
+        ]
+        if updates:
+            db.execute(update(Receipt), updates)
+            receipts_changed(db)
+            db.commit()
+            changed += len(updates)
+        last_id = rows[-1].id
+
+
+def bucket_start(day: date, period: str) -> date:
+    if period == "weekly":
+        return day - timedelta(days=day.weekday())
+    if period == "monthly":
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: date, period: str) -> date:
+    if period == "weekly":
+        return start + timedelta(days=7)
+    if period == "monthly":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def default_window(period: str, date_to: date | None) -> tuple[date, date]:
+    date_to = date_to or datetime.utcnow().date()
+    start = bucket_start(date_to, period)
+    for _ in range(_DEFAULT_SPAN[period] - 1):
+        if start == date.min:
+            break
+        start = bucket_start(start - timedelta(days=1), period)
+    return start, date_to
+
+
+def spending_series(
+    db: Session,
+    period: str,
+    date_from: date,
+    date_to: date,
+    category: str | None = None,
+) -> list[dict]:
+    """Spending per day/week (Monday start)/month of `purchased_at`, empty buckets included.
+
+    SQL sums per day over a range of the (category,) purchased_at index, which
+    also holds total_amount; days are folded into weeks/months here.
+    """
+
+    if date_from > date_to:
+        raise ValueError("date_from is after date_to")
+    buckets: dict[date, list] = {}
+    start = bucket_start(date_from, period)
+    while start <= date_to:
+        if len(buckets) == MAX_BUCKETS:
+            raise ValueError(f"Window too long (max {MAX_BUCKETS} {period} buckets)")
+        buckets[start] = [0.0, 0]
+        try:
+            start = _next_bucket(start, period)
+        except OverflowError:
+            # The bucket holding date.max was the last one.
+            break
+
+    day = func.date(Receipt.purchased_at)
+    query = (
+        select(day, func.coalesce(func.sum(Receipt.total_amount), 0.0), func.count())
+        .where(Receipt.purchased_at >= datetime.combine(date_from, datetime.min.time()))
+        # Inclusive end of day: date_to + 1 day overflows at date.max.
+        .where(Receipt.purchased_at <= datetime.combine(date_to, datetime.max.time()))
+        .group_by(day)
+    )
+    if category is not None:
+        query = query.where(Receipt.category == category)
+
+    for d, total, count in db.execute(query):
+        entry = buckets[bucket_start(as_date(d), period)]
+        entry[0] += float(total)
+        entry[1] += int(count)
+
+    return [
+        {"start": start.isoformat(), "total": total, "receipts": count}
+        for start, (total, count) in buckets.items()
+    ]
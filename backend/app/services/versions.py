@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import DataVersion
+
+
+# Bumped by every write to receipts / receipt_items (export and stats caches key on it)
+RECEIPTS_VERSION_KEY = "receipts"
+
+
+def get_version(db: Session, name: str) -> int:
+    version = db.scalar(select(DataVersion.version).where(DataVersion.name == name))
+    return int(version or 0)
+
+
+def bump_version(db: Session, name: str) -> None:
+    """Increment the change counter for `name` in the caller's transaction."""
+
+    result = db.execute(
+        update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+    )
+    if result.rowcount:
+        return
+
+    # First change ever: create the row (another writer may race us to it).
+    try:
+        with db.begin_nested():
+            db.add(DataVersion(name=name, version=1))
+    except IntegrityError:
+        db.execute(
+            update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+        )
+
+
+def receipts_changed(db: Session) -> None:
+    # Called last before commit: the version row is locked until the transaction ends.
+    bump_version(db, RECEIPTS_VERSION_KEY)
+
+
+def receipts_version(db: Session) -> int:
+    return get_version(db, RECEIPTS_VERSION_KEY)
+
+
+class VersionedCache:
+    """Small in-process LRU of computed results for one data version.
+
+    Entries are dropped as soon as a newer version is seen, so a hit is always
+    current as of the version the caller just read.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._version: int | None = None
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def lookup(self, version: int, key: Hashable) -> tuple[bool, Any]:
+        with self._lock:
+            if self._version == version and key in self._entries:
+                self._entries.move_to_end(key)
+                return True, self._entries[key]
+        return False, None
+
+    def store(self, version: int, key: Hashable, value: Any) -> None:
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._version = version
+                self._entries.clear()
+            if version == self._version:
+                self._entries[key] = value
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def get(self, version: int, key: Hashable, compute: Callable[[], Any]) -> Any:
+        hit, value = self.lookup(version, key)
+        if not hit:
+            value = compute()
+            self.store(version, key, value)
+        return value
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import signal
+import threading
+
+from .config import get_settings
+from .db import SessionLocal, engine
+from .migrations import ensure_schema
+from .services.category import seed_rules
+from .services.ingest import create_excel_compactor
+from .services.jobs import create_worker
+from .services.metrics import serve_metrics
+from .services.ocr_pool import shutdown_ocr_pool
+
+
+def main() -> None:
+    """Standalone ingestion worker: `python -m backend.app.worker`.
+
+    Run as many of these as needed (on one or several nodes); they share the job
+    table and claim work with row locking. SIGTERM/SIGINT drain in-flight jobs.
+    """
+
+    ensure_schema(engine)
+    with SessionLocal() as db:
+        seed_rules(db)
+
+    stopping = threading.Event()
+
+    def _request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    worker = create_worker()
+    worker.start()
+    compactor = create_excel_compactor()
+    if compactor is not None:
+        compactor.start()
+    metrics_port = get_settings().worker_metrics_port
+    if metrics_port:
+        serve_metrics(metrics_port)
+    print(f"Ingestion worker {worker.worker_id} started ({worker.threads} threads)")
+
+    stopping.wait()
+    print("Stopping: finishing in-flight jobs...")
+    worker.stop()
+    shutdown_ocr_pool()
+    if compactor is not None:
+        compactor.stop()
+
+
+if __name__ == "__main__":
+    main()
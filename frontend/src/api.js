@@ -27,12 +27,27 @@ export function apiUrl(path) {
   return withBase(path);
 }
 
+// Stored uploads are "uploads/ab/cd/<sha256>.<ext>" (older ones: a flat
+// "<uuid hex>.<ext>" under the upload dir), served from /uploads/; their WebP
+// derivatives live at /uploads/<size>/<name>.webp (size: "thumb" or "view").
+// Anything else (demo images, absolute URLs) is returned as is.
+export function imageUrl(imagePath, size) {
+  if (!imagePath) return "";
+  if (imagePath.startsWith("http")) return imagePath;
+  const stored = imagePath.match(
+    /(?:^|\/)((?:[0-9a-f]{2}\/[0-9a-f]{2}\/)?)([0-9a-f]{64}|[0-9a-f]{32})(\.[a-z]+)$/i
+  );
+  if (!stored) return `/${imagePath.replace(/^\/+/, "")}`;
+  const [, shard, name, ext] = stored;
+  return apiUrl(size ? `/uploads/${size}/${name}.webp` : `/uploads/${shard}${name}${ext}`);
+}
+
 export function isDemoMode() {
   return DEMO_MODE;
 }
 
 function isReceiptsList(path) {
-  return path === "/api/receipts";
+  return path.split("?")[0] === "/api/receipts";
 }
 
 function isReceiptDetail(path) {
@@ -80,6 +95,23 @@ export async function apiGet(path) {
   return await res.json();
 }
 
+// For paginated lists: the body plus the cursor of the next page (null on the last one).
+export async function apiGetPage(path) {
+  if (DEMO_MODE) {
+    return { data: await apiGet(path), nextCursor: null };
+  }
+
+  const res = await fetch(withBase(path), { headers: defaultHeaders });
+  if (!res.ok) {
+    const text = await res.text();
+    throw new Error(text || `HTTP ${res.status}`);
+  }
+  return {
+    data: await res.json(),
+    nextCursor: res.headers.get("X-Next-Cursor"),
+  };
+}
+
 export async function apiPutJson(path, payload) {
   if (DEMO_MODE) {
     if (isReceiptItems(path)) {
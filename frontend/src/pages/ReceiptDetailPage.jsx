@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { Link, useParams } from "react-router-dom";
-import { apiGet } from "../api";
+import { apiGet, imageUrl } from "../api";
 
 function formatMoney(v) {
   if (v === null || v === undefined) return "";
@@ -98,15 +98,13 @@ export default function ReceiptDetailPage() {
             Ảnh hóa đơn
           </div>
           <div className="p-4">
-            <img
-              src={
-                item.image_path.startsWith("http")
-                  ? item.image_path
-                  : `/${item.image_path.replace(/^\/+/, "")}`
-              }
-              alt="receipt"
-              className="max-h-[720px] w-auto rounded-md border"
-            />
+            <a href={imageUrl(item.image_path)} target="_blank" rel="noreferrer">
+              <img
+                src={imageUrl(item.image_path, "view")}
+                alt="receipt"
+                className="max-h-[720px] w-auto rounded-md border"
+              />
+            </a>
           </div>
         </div>
 
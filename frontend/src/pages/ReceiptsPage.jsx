@@ -1,6 +1,6 @@
 import { useEffect, useMemo, useState } from "react";
 import { Link } from "react-router-dom";
-import { apiGet, apiUrl, isDemoMode } from "../api";
+import { apiGetPage, apiUrl, imageUrl, isDemoMode } from "../api";
 
 function formatMoney(v) {
   if (v === null || v === undefined) return "";
@@ -11,10 +11,20 @@ function formatMoney(v) {
   }
 }
 
+const PAGE_SIZE = 50;
+
+function pagePath(cursor) {
+  const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+  if (cursor) params.set("cursor", cursor);
+  return `/api/receipts?${params}`;
+}
+
 export default function ReceiptsPage() {
   const [items, setItems] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const demoMode = isDemoMode();
 
@@ -25,10 +35,11 @@ export default function ReceiptsPage() {
 
   useEffect(() => {
     let mounted = true;
-    apiGet("/api/receipts")
-      .then((data) => {
+    apiGetPage(pagePath(null))
+      .then(({ data, nextCursor }) => {
         if (!mounted) return;
         setItems(Array.isArray(data) ? data : []);
+        setNextCursor(nextCursor);
         setError("");
       })
       .catch((e) => {
@@ -45,6 +56,18 @@ export default function ReceiptsPage() {
     };
   }, []);
 
+  function handleLoadMore() {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    apiGetPage(pagePath(nextCursor))
+      .then(({ data, nextCursor }) => {
+        setItems((prev) => prev.concat(Array.isArray(data) ? data : []));
+        setNextCursor(nextCursor);
+      })
+      .catch((e) => setError(e?.message || String(e)))
+      .finally(() => setLoadingMore(false));
+  }
+
   const total = useMemo(() => {
     return items.reduce(
       (sum, r) =>
@@ -115,6 +138,7 @@ export default function ReceiptsPage() {
           <table className="w-full text-left text-sm">
             <thead className="bg-slate-50 text-xs uppercase text-slate-600">
               <tr>
+                <th className="px-4 py-3">Ảnh</th>
                 <th className="px-4 py-3">Cửa hàng</th>
                 <th className="px-4 py-3">Ngày</th>
                 <th className="px-4 py-3">Tổng tiền</th>
@@ -125,6 +149,16 @@ export default function ReceiptsPage() {
             <tbody>
               {items.map((r) => (
                 <tr key={r.id} className="border-t">
+                  <td className="px-4 py-2">
+                    {r.image_path && (
+                      <img
+                        src={imageUrl(r.image_path, "thumb")}
+                        alt=""
+                        loading="lazy"
+                        className="h-12 w-12 rounded border object-cover"
+                      />
+                    )}
+                  </td>
                   <td className="px-4 py-3 font-medium">
                     {r.store_name || "-"}
                   </td>
@@ -147,7 +181,7 @@ export default function ReceiptsPage() {
                 <tr>
                   <td
                     className="px-4 py-6 text-center text-slate-500"
-                    colSpan={5}
+                    colSpan={6}
                   >
                     Chưa có dữ liệu. Hãy tải hóa đơn đầu tiên.
                   </td>
@@ -158,6 +192,19 @@ export default function ReceiptsPage() {
         </div>
       )}
 
+      {!loading && !error && nextCursor && (
+        <div className="flex justify-center">
+          <button
+            type="button"
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="inline-flex items-center justify-center rounded-md border bg-white px-4 py-2 text-sm font-medium text-slate-900 hover:bg-slate-50 disabled:cursor-not-allowed disabled:opacity-60"
+          >
+            {loadingMore ? "Đang tải…" : "Xem thêm"}
+          </button>
+        </div>
+      )}
+
       {/* <div className="text-xs text-slate-500">
         Lưu ý: OCR có thể sai; bạn có thể cải thiện bằng ảnh rõ nét và đủ sáng.
       </div> */}
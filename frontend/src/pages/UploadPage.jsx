@@ -1,6 +1,25 @@
 import { useMemo, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { apiPostForm } from "../api";
+import { apiGet, apiPostForm } from "../api";
+
+const JOB_POLL_MS = 1000;
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+// Upload returns 202 + an ingestion job; wait until the worker has created the receipt.
+async function waitForReceiptId(job) {
+  let current = job;
+  while (current.status === "queued" || current.status === "running") {
+    await sleep(JOB_POLL_MS);
+    current = await apiGet(`/api/jobs/${current.id}`);
+  }
+  if (current.status !== "done" || !current.receipt_id) {
+    throw new Error(current.error || "OCR thất bại");
+  }
+  return current.receipt_id;
+}
 
 export default function UploadPage() {
   const nav = useNavigate();
@@ -23,8 +42,10 @@ export default function UploadPage() {
     try {
       const form = new FormData();
       form.append("file", file);
-      const receipt = await apiPostForm("/api/receipts/upload", form);
-      nav(`/receipts/${receipt.id}`);
+      const res = await apiPostForm("/api/receipts/upload", form);
+      // Demo mode returns the receipt directly.
+      const receiptId = res.status ? await waitForReceiptId(res) : res.id;
+      nav(`/receipts/${receiptId}`);
     } catch (e2) {
       setError(e2?.message || String(e2));
     } finally {